@@ -0,0 +1,232 @@
+"""
+Разделение сканированных чертежей вырезанием фрагментов изображения
+
+Если страница состоит из одного большого изображения (скан), каждая часть
+получает только свой фрагмент пикселей вместо всего скана целиком:
+- PNG/Flate/CCITT - вырезание без потерь (фрагмент сохраняется в PNG,
+  однобитные сканы остаются однобитными);
+- JPEG - фрагмент выравнивается по границам MCU и кодируется с исходными
+  таблицами квантования и субдискретизацией, поэтому блоки DCT
+  совпадают с исходными и повторное сжатие почти не вносит потерь.
+"""
+import io
+import math
+
+import fitz  # PyMuPDF
+from PIL import Image, JpegImagePlugin
+
+
+class ScanImage:
+    """
+    Изображение, занимающее всю страницу
+
+    Хранит только описание изображения: данные читаются из документа
+    при первом обращении к image и освобождаются release().
+    """
+
+    def __init__(self, document, xref, rect, width, height, bpc, is_jpeg):
+        self.document = document
+        self.xref = xref
+        self.rect = rect
+        self.width = width
+        self.height = height
+        self.bpc = bpc
+        self.is_jpeg = is_jpeg
+        self.components = None
+        self._image = None
+
+    @property
+    def image(self):
+        """Декодированное изображение (загружается при первом обращении)"""
+        if self._image is None:
+            if self.is_jpeg:
+                # Поток DCTDecode - готовый файл JPEG
+                self._image = Image.open(io.BytesIO(self.document.xref_stream_raw(self.xref)))
+                self._image.load()
+            else:
+                self._image = self._decode_pixmap()
+        return self._image
+
+    def _decode_pixmap(self):
+        """Декодирование средствами MuPDF (Flate, CCITT, JBIG2 и др.)"""
+        pix = fitz.Pixmap(self.document, self.xref)
+        if pix.alpha:
+            pix = fitz.Pixmap(pix, 0)
+        if pix.n not in (1, 3):
+            pix = fitz.Pixmap(fitz.csRGB, pix)
+        self.components = pix.n
+        mode = 'L' if pix.n == 1 else 'RGB'
+        return Image.frombytes(mode, (pix.width, pix.height), pix.samples,
+                               'raw', mode, pix.stride)
+
+    def release(self):
+        """Освобождение декодированного изображения"""
+        if self._image is not None:
+            self._image.close()
+            self._image = None
+
+    def _block_size(self):
+        """Размер блока выравнивания (MCU для JPEG)"""
+        if not self.is_jpeg:
+            return 1, 1
+        layers = getattr(self.image, 'layer', None) or []
+        h_max = max((layer[1] for layer in layers), default=1)
+        v_max = max((layer[2] for layer in layers), default=1)
+        return 8 * h_max, 8 * v_max
+
+    def _source_mode(self):
+        """Режим Pillow, соответствующий цветовому пространству изображения в PDF"""
+        if self.components == 1:
+            return '1' if self.bpc == 1 else 'L'
+        if self.components == 3:
+            return 'RGB'
+        return None
+
+    @property
+    def scale(self):
+        """Пикселей изображения на point страницы (по x и y)"""
+        return self.width / self.rect.width, self.height / self.rect.height
+
+    def pixel_box(self, clip):
+        """
+        Пиксельные границы фрагмента, покрывающего область страницы clip
+
+        Returns:
+            tuple: (x0, y0, x1, y1) или None, если clip вне изображения
+        """
+        visible = clip & self.rect
+        if visible.is_empty:
+            return None
+
+        scale_x, scale_y = self.scale
+        block_w, block_h = self._block_size()
+
+        # Пиксельные границы с выравниванием наружу
+        x0 = int(math.floor((visible.x0 - self.rect.x0) * scale_x / block_w)) * block_w
+        y0 = int(math.floor((visible.y0 - self.rect.y0) * scale_y / block_h)) * block_h
+        x1 = min(self.width,
+                 int(math.ceil((visible.x1 - self.rect.x0) * scale_x / block_w)) * block_w)
+        y1 = min(self.height,
+                 int(math.ceil((visible.y1 - self.rect.y0) * scale_y / block_h)) * block_h)
+        x0, y0 = max(0, x0), max(0, y0)
+        if x1 <= x0 or y1 <= y0:
+            return None
+        return x0, y0, x1, y1
+
+    def fragment_rect(self, box):
+        """Область страницы, занимаемая фрагментом с пиксельными границами box"""
+        scale_x, scale_y = self.scale
+        x0, y0, x1, y1 = box
+        return fitz.Rect(
+            self.rect.x0 + x0 / scale_x,
+            self.rect.y0 + y0 / scale_y,
+            self.rect.x0 + x1 / scale_x,
+            self.rect.y0 + y1 / scale_y
+        )
+
+    def crop(self, clip):
+        """
+        Фрагмент изображения, покрывающий область страницы clip
+
+        Returns:
+            tuple: (байты изображения, область фрагмента на странице) или None
+        """
+        box = self.pixel_box(clip)
+        if box is None:
+            return None
+
+        image = self.image
+        fragment = image.crop(box)
+        buffer = io.BytesIO()
+        options = {}
+        icc_profile = image.info.get('icc_profile')
+        if icc_profile:
+            options['icc_profile'] = icc_profile
+
+        if self.is_jpeg:
+            options['qtables'] = image.quantization
+            sampling = JpegImagePlugin.get_sampling(image)
+            if sampling != -1:
+                options['subsampling'] = sampling
+            fragment.save(buffer, 'JPEG', **options)
+        else:
+            # Однобитный скан декодируется в оттенки серого -
+            # возвращаем исходную глубину цвета
+            mode = self._source_mode()
+            if mode and fragment.mode != mode:
+                fragment = fragment.convert(mode, dither=Image.Dither.NONE)
+            fragment.save(buffer, 'PNG', **options)
+
+        return buffer.getvalue(), self.fragment_rect(box)
+
+    def insert_part(self, new_page, mask):
+        """
+        Вставка фрагмента скана на страницу части
+
+        Returns:
+            bool: True если фрагмент вставлен
+        """
+        clip = fitz.Rect(mask['x'], mask['y'],
+                         mask['x'] + mask['width'], mask['y'] + mask['height'])
+        cropped = self.crop(clip)
+        if cropped is None:
+            # Маска вне изображения - часть остается пустой
+            return True
+
+        data, fragment_rect = cropped
+        # Координаты фрагмента относительно начала маски
+        target = fragment_rect + (-clip.x0, -clip.y0, -clip.x0, -clip.y0)
+        new_page.insert_image(target, stream=data, keep_proportion=False)
+        return True
+
+
+def find_scan_image(page, min_coverage=0.9):
+    """
+    Поиск единственного изображения, занимающего страницу
+
+    Страница считается сканом, если на ней одно изображение без поворота
+    и маски прозрачности, оно покрывает не меньше min_coverage площади,
+    а текста и векторной графики нет.
+
+    Returns:
+        ScanImage или None
+    """
+    if page.rotation:
+        return None
+
+    images = page.get_images(full=True)
+    if len(images) != 1:
+        return None
+    xref, smask = images[0][0], images[0][1]
+    if smask:
+        return None
+
+    placements = page.get_image_rects(xref, transform=True)
+    if len(placements) != 1:
+        return None
+    rect, matrix = placements[0]
+    # Только прямое размещение без поворота и отражения
+    if abs(matrix.b) > 1e-3 or abs(matrix.c) > 1e-3 or matrix.a <= 0 or matrix.d <= 0:
+        return None
+
+    page_area = page.rect.width * page.rect.height
+    if page_area <= 0 or (rect & page.rect).get_area() / page_area < min_coverage:
+        return None
+
+    if page.get_text("text").strip() or page.get_drawings():
+        return None
+
+    document = page.parent
+    _, filters = document.xref_get_key(xref, 'Filter')
+    if 'JPXDecode' in filters:
+        return None
+    is_jpeg = filters == '/DCTDecode'
+    if is_jpeg:
+        # CMYK JPEG (Adobe) хранится инвертированным - надежнее обычный путь
+        # (читается только заголовок)
+        with Image.open(io.BytesIO(document.xref_stream_raw(xref))) as header:
+            if header.mode == 'CMYK':
+                return None
+
+    width, height, bpc = images[0][2], images[0][3], images[0][4]
+    return ScanImage(document, xref, fitz.Rect(rect), width, height, bpc, is_jpeg)
@@ -0,0 +1,144 @@
+"""
+Шаблоны раскладки масок для листов одинакового размера
+"""
+import copy
+
+
+class MaskTemplateStore:
+    """
+    Хранилище шаблонов раскладки масок
+
+    Шаблон вычисляется один раз для каждого сочетания
+    (формат листа, размер листа с точностью до допуска, формат маски,
+    ориентация маски, перекрытие) и применяется ко всем подходящим листам.
+    Ручные правки пользователя сохраняются как переопределения шаблона.
+    """
+
+    def __init__(self, size_tolerance_mm=2.0):
+        self.size_tolerance_mm = size_tolerance_mm
+        self.templates = {}   # ключ -> маски, вычисленные generate_masks
+        self.overrides = {}   # ключ -> маски, отредактированные пользователем
+
+    def make_key(self, pdf_handler, page_num=0, mask_format='A4',
+                 mask_landscape=False, overlap_percent=15):
+        """Ключ шаблона для страницы"""
+        size_mm = pdf_handler.get_page_size_mm(page_num)
+        if not size_mm:
+            return None
+
+        width_mm, height_mm = size_mm
+        key = (
+            pdf_handler.detect_format(page_num),
+            round(width_mm, 1),
+            round(height_mm, 1),
+            mask_format,
+            bool(mask_landscape),
+            round(float(overlap_percent), 2),
+        )
+        return self._find_key(key) or key
+
+    def _find_key(self, key):
+        """
+        Сохраненный ключ с размером листа в пределах допуска
+
+        Размеры сравниваются с уже известными листами, а не округляются
+        до фиксированной сетки: иначе 840.9 и 841.1 мм попадают в разные
+        шаблоны.
+        """
+        sheet_format, width_mm, height_mm, *mask_params = key
+        best, best_distance = None, None
+        for known in set(self.templates) | set(self.overrides):
+            known_format, known_width, known_height, *known_params = known
+            if known_format != sheet_format or known_params != mask_params:
+                continue
+            distance = max(abs(known_width - width_mm), abs(known_height - height_mm))
+            if distance <= self.size_tolerance_mm and (best is None or distance < best_distance):
+                best, best_distance = known, distance
+        return best
+
+    def get_masks(self, pdf_handler, page_num=0, overlap_percent=15,
+                  mask_format='A4', mask_landscape=False):
+        """
+        Маски для страницы: переопределение пользователя, шаблон
+        или новая раскладка (которая сохраняется как шаблон)
+
+        Returns:
+            list: копия списка масок (изменения не затрагивают шаблон)
+        """
+        key = self.make_key(pdf_handler, page_num, mask_format,
+                            mask_landscape, overlap_percent)
+        if key is None:
+            return []
+
+        if key in self.overrides:
+            return copy.deepcopy(self.overrides[key])
+
+        if key not in self.templates:
+            self.templates[key] = pdf_handler.generate_masks(
+                page_num=page_num,
+                overlap_percent=overlap_percent,
+                mask_format=mask_format,
+                mask_landscape=mask_landscape
+            )
+            return copy.deepcopy(self.templates[key])
+
+        fitted = self._fit_to_page(
+            self.templates[key],
+            pdf_handler.get_page_size_points(page_num),
+            pdf_handler.get_format_size_in_points(mask_format),
+            mask_landscape
+        )
+        if fitted is None:
+            # Лист больше шаблонного в пределах допуска: сетке шаблона
+            # не хватает столбца или строки, раскладка строится заново
+            fitted = pdf_handler.generate_masks(
+                page_num=page_num,
+                overlap_percent=overlap_percent,
+                mask_format=mask_format,
+                mask_landscape=mask_landscape
+            )
+        return fitted
+
+    @staticmethod
+    def _fit_to_page(masks, page_size, mask_size, mask_landscape):
+        """
+        Подгонка масок шаблона к странице
+
+        Листы одного шаблона могут отличаться на величину допуска,
+        поэтому крайние маски обрезаются (или расширяются) по странице.
+
+        Returns:
+            list: маски или None, если они не покрывают правый
+            или нижний край страницы
+        """
+        page_width, page_height = page_size
+        mask_width, mask_height = mask_size
+        if mask_landscape:
+            mask_width, mask_height = mask_height, mask_width
+
+        fitted = []
+        for mask in masks:
+            if mask['x'] >= page_width or mask['y'] >= page_height:
+                continue
+            mask = dict(mask)
+            mask['width'] = min(mask_width, page_width - mask['x'])
+            mask['height'] = min(mask_height, page_height - mask['y'])
+            fitted.append(mask)
+
+        if not fitted:
+            return None
+        right = max(mask['x'] + mask['width'] for mask in fitted)
+        bottom = max(mask['y'] + mask['height'] for mask in fitted)
+        if right < page_width - 0.01 or bottom < page_height - 0.01:
+            return None
+        return fitted
+
+    def set_override(self, key, masks):
+        """Сохранение ручных правок для шаблона"""
+        if key is None:
+            return
+        self.overrides[key] = copy.deepcopy(masks)
+
+    def clear_override(self, key):
+        """Сброс ручных правок (возврат к вычисленному шаблону)"""
+        self.overrides.pop(key, None)
@@ -0,0 +1,199 @@
+"""
+Анализ содержимого страницы для размещения швов между масками
+
+Строится пространственный индекс текстовых фрагментов и плотных областей
+векторной графики. Стоимость шва (линии реза) вычисляется по сеткам
+с префиксными суммами за O(1) на каждую позицию, что позволяет подбирать
+положение масок прямо во время перетаскивания.
+"""
+import numpy as np
+
+
+def collect_text_spans(page):
+    """
+    Текстовые фрагменты страницы
+
+    Returns:
+        tuple: (массив n×4 прямоугольников, список текстов)
+    """
+    boxes = []
+    texts = []
+    for block in page.get_text("dict")["blocks"]:
+        for line in block.get("lines", []):
+            for span in line["spans"]:
+                text = span["text"].strip()
+                if not text:
+                    continue
+                boxes.append(span["bbox"])
+                texts.append(text)
+    return np.array(boxes, dtype=np.float64).reshape(-1, 4), texts
+
+
+class PageSpatialIndex:
+    """Пространственный индекс текста и графики страницы"""
+
+    # Векторные объекты крупнее этого размера (pt) не считаются плотной графикой:
+    # разрез длинной линии или рамки не мешает чтению чертежа
+    DENSE_PATH_MAX_SIZE = 60.0
+
+    def __init__(self, page, cell_size=2.0, text_weight=10.0, drawing_weight=1.0):
+        self.cell_size = cell_size
+        rect = page.rect
+        self.page_width = rect.width
+        self.page_height = rect.height
+        self.cols = max(1, int(np.ceil(rect.width / cell_size)))
+        self.rows = max(1, int(np.ceil(rect.height / cell_size)))
+
+        self.span_boxes, _ = collect_text_spans(page)
+        drawing_boxes = self._collect_drawings(page)
+
+        boxes = [self.span_boxes, drawing_boxes]
+        weights = [
+            np.full(len(self.span_boxes), text_weight, dtype=np.float64),
+            np.full(len(drawing_boxes), drawing_weight, dtype=np.float64),
+        ]
+        all_boxes = np.concatenate(boxes) if any(len(b) for b in boxes) \
+            else np.zeros((0, 4))
+        all_weights = np.concatenate(weights)
+
+        # Стоимость вертикального шва в ячейке: объекты, которые он разрезает
+        self._v_cum = self._build_cut_grid(all_boxes, all_weights, vertical=True)
+        # Стоимость горизонтального шва
+        self._h_cum = self._build_cut_grid(all_boxes, all_weights, vertical=False)
+
+    @property
+    def nbytes(self):
+        """Занимаемая индексом память"""
+        return self._v_cum.nbytes + self._h_cum.nbytes + self.span_boxes.nbytes
+
+    def _collect_drawings(self, page):
+        boxes = []
+        for path in page.get_drawings():
+            rect = path["rect"]
+            if max(rect.width, rect.height) <= self.DENSE_PATH_MAX_SIZE:
+                boxes.append((rect.x0, rect.y0, rect.x1, rect.y1))
+        return np.array(boxes, dtype=np.float64).reshape(-1, 4)
+
+    def _build_cut_grid(self, boxes, weights, vertical):
+        """
+        Сетка стоимости разреза с накоплением вдоль направления шва
+
+        Для вертикального шва ячейка (r, c) получает вес всех объектов,
+        которые перекрывают строку r и строго содержат линию x = c * cell
+        внутри себя. Результат накапливается по строкам, чтобы стоимость шва
+        на отрезке [r0, r1) вычислялась разностью двух значений.
+        """
+        rows, cols = self.rows, self.cols
+        # float32: на листе A0x3 сетка float64 занимает ~100 МБ, а точности
+        # float32 хватает для сравнения стоимостей швов
+        diff = np.zeros((rows + 2, cols + 2), dtype=np.float32)
+
+        if len(boxes):
+            cell = self.cell_size
+            if vertical:
+                # Линии, лежащие строго внутри объекта по x
+                a0 = np.floor(boxes[:, 0] / cell).astype(int) + 1
+                a1 = np.ceil(boxes[:, 2] / cell).astype(int)
+                b0 = np.floor(boxes[:, 1] / cell).astype(int)
+                b1 = np.ceil(boxes[:, 3] / cell).astype(int)
+                c0, c1, r0, r1 = a0, a1, b0, b1
+            else:
+                a0 = np.floor(boxes[:, 1] / cell).astype(int) + 1
+                a1 = np.ceil(boxes[:, 3] / cell).astype(int)
+                b0 = np.floor(boxes[:, 0] / cell).astype(int)
+                b1 = np.ceil(boxes[:, 2] / cell).astype(int)
+                r0, r1, c0, c1 = a0, a1, b0, b1
+
+            r0 = np.clip(r0, 0, rows)
+            r1 = np.clip(r1, 0, rows)
+            c0 = np.clip(c0, 0, cols)
+            c1 = np.clip(c1, 0, cols)
+            valid = (r1 > r0) & (c1 > c0)
+            r0, r1, c0, c1, w = r0[valid], r1[valid], c0[valid], c1[valid], weights[valid]
+
+            # Двумерный разностный массив: по одному обновлению на объект
+            np.add.at(diff, (r0, c0), w)
+            np.add.at(diff, (r0, c1), -w)
+            np.add.at(diff, (r1, c0), -w)
+            np.add.at(diff, (r1, c1), w)
+
+        grid = diff.cumsum(axis=0).cumsum(axis=1)[:rows + 1, :cols + 1]
+
+        # Накопление вдоль шва (с нулевой строкой/столбцом в начале)
+        if vertical:
+            cum = np.zeros((rows + 2, cols + 1), dtype=np.float32)
+            cum[1:] = grid.cumsum(axis=0)
+        else:
+            cum = np.zeros((rows + 1, cols + 2), dtype=np.float32)
+            cum[:, 1:] = grid.cumsum(axis=1)
+        return cum
+
+    def vertical_seam_costs(self, xs, y0, y1):
+        """Стоимость вертикальных швов x = xs на отрезке [y0, y1]"""
+        xs = np.asarray(xs, dtype=np.float64)
+        cols = np.rint(xs / self.cell_size).astype(int)
+        r0 = int(np.clip(np.floor(y0 / self.cell_size), 0, self.rows))
+        r1 = int(np.clip(np.ceil(y1 / self.cell_size), 0, self.rows))
+        costs = np.zeros(len(xs), dtype=np.float64)
+        # Швы по краю страницы и за ее пределами ничего не разрезают
+        inside = (cols > 0) & (cols < self.cols)
+        if r1 > r0 and inside.any():
+            c = cols[inside]
+            costs[inside] = self._v_cum[r1, c] - self._v_cum[r0, c]
+        return costs
+
+    def horizontal_seam_costs(self, ys, x0, x1):
+        """Стоимость горизонтальных швов y = ys на отрезке [x0, x1]"""
+        ys = np.asarray(ys, dtype=np.float64)
+        rows = np.rint(ys / self.cell_size).astype(int)
+        c0 = int(np.clip(np.floor(x0 / self.cell_size), 0, self.cols))
+        c1 = int(np.clip(np.ceil(x1 / self.cell_size), 0, self.cols))
+        costs = np.zeros(len(ys), dtype=np.float64)
+        inside = (rows > 0) & (rows < self.rows)
+        if c1 > c0 and inside.any():
+            r = rows[inside]
+            costs[inside] = self._h_cum[r, c1] - self._h_cum[r, c0]
+        return costs
+
+    def mask_seam_cost(self, x, y, width, height):
+        """Суммарная стоимость четырех краев маски"""
+        return float(
+            self.vertical_seam_costs([x, x + width], y, y + height).sum() +
+            self.horizontal_seam_costs([y, y + height], x, x + width).sum()
+        )
+
+    def snap_mask(self, x, y, width, height, dx_range, dy_range):
+        """
+        Подбор положения маски с минимальной стоимостью швов
+
+        Args:
+            x, y, width, height: текущее положение маски (pt)
+            dx_range: допустимый сдвиг по x (min, max)
+            dy_range: допустимый сдвиг по y (min, max)
+
+        Returns:
+            tuple: новое положение (x, y)
+        """
+        dx = self._best_shift(
+            dx_range,
+            lambda shifts: self.vertical_seam_costs(x + shifts, y, y + height) +
+            self.vertical_seam_costs(x + width + shifts, y, y + height)
+        )
+        x += dx
+        dy = self._best_shift(
+            dy_range,
+            lambda shifts: self.horizontal_seam_costs(y + shifts, x, x + width) +
+            self.horizontal_seam_costs(y + height + shifts, x, x + width)
+        )
+        return x, y + dy
+
+    def _best_shift(self, shift_range, cost_function):
+        low, high = shift_range
+        if high - low < self.cell_size:
+            return 0.0 if low <= 0 <= high else low
+        shifts = np.arange(low, high + 1e-9, self.cell_size)
+        shifts = np.append(shifts, 0.0) if low <= 0 <= high else shifts
+        costs = cost_function(shifts)
+        # При равной стоимости предпочитаем меньший сдвиг
+        costs = costs + np.abs(shifts) * 1e-6
+        return float(shifts[int(np.argmin(costs))])
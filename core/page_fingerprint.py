@@ -0,0 +1,202 @@
+"""
+Отпечатки страниц для поиска дубликатов
+
+Точный отпечаток - хэш потока содержимого и всех используемых ресурсов
+(номера объектов PDF заменяются хэшами самих объектов, поэтому одинаковые
+листы из разных документов дают одинаковый отпечаток).
+Перцептивный отпечаток (dHash рендера низкого разрешения) находит
+почти одинаковые листы.
+"""
+import copy
+import hashlib
+import os
+import re
+import shutil
+
+import fitz  # PyMuPDF
+import numpy as np
+
+
+REFERENCE_RE = re.compile(rb'(\d+) 0 R')
+
+# Ключи, ведущие вверх по дереву документа: их содержимое не влияет на вид листа
+SKIPPED_KEYS = re.compile(rb'/(Parent|P|StructParents|StructParent)\s+(\d+ 0 R|\d+)')
+
+PHASH_SIZE = 16
+
+
+def _object_digest(document, xref, memo, stack):
+    """Хэш объекта PDF с рекурсивной заменой ссылок на хэши объектов"""
+    if xref in memo:
+        return memo[xref]
+    if xref in stack:
+        return b'cycle'
+
+    stack.add(xref)
+    try:
+        source = document.xref_object(xref, compressed=False).encode('latin-1', 'replace')
+    except Exception:
+        source = b''
+    digest = hashlib.sha256(_resolve_references(document, source, memo, stack))
+    if document.xref_is_stream(xref):
+        digest.update(document.xref_stream_raw(xref) or b'')
+    stack.discard(xref)
+
+    memo[xref] = digest.hexdigest().encode()
+    return memo[xref]
+
+
+def _resolve_references(document, source, memo, stack):
+    source = SKIPPED_KEYS.sub(b'', source)
+    return REFERENCE_RE.sub(
+        lambda match: b'<' + _object_digest(document, int(match.group(1)), memo, stack) + b'>',
+        source
+    )
+
+
+def _page_resources(document, page):
+    """Исходный текст словаря ресурсов страницы (с учетом наследования)"""
+    xref = page.xref
+    while xref:
+        kind, value = document.xref_get_key(xref, 'Resources')
+        if kind != 'null':
+            return value.encode('latin-1', 'replace')
+        kind, value = document.xref_get_key(xref, 'Parent')
+        if kind != 'xref':
+            break
+        xref = int(value.split()[0])
+    return b''
+
+
+def content_hash(document, page_num):
+    """Точный отпечаток страницы: содержимое, ресурсы, размер и поворот"""
+    page = document[page_num]
+    digest = hashlib.sha256()
+    rect = page.rect
+    digest.update(f"{rect.width:.2f}x{rect.height:.2f}r{page.rotation}".encode())
+    digest.update(page.read_contents())
+
+    memo = {}
+    resources = _page_resources(document, page)
+    digest.update(_resolve_references(document, resources, memo, set()))
+    return digest.hexdigest()
+
+
+def perceptual_hash(page):
+    """
+    Перцептивный отпечаток (dHash) рендера низкого разрешения
+
+    Returns:
+        int: 256-битное значение
+    """
+    rect = page.rect
+    # Рендер 8×8 пикселей на ячейку с последующим усреднением
+    width = (PHASH_SIZE + 1) * 8
+    height = PHASH_SIZE * 8
+    matrix = fitz.Matrix(width / rect.width, height / rect.height)
+    pix = page.get_pixmap(matrix=matrix, colorspace=fitz.csGRAY, alpha=False)
+
+    image = np.frombuffer(pix.samples_mv, dtype=np.uint8)
+    image = image.reshape(pix.height, pix.stride)[:, :pix.width].astype(np.float32)
+    # Подгоняем к точному размеру (округление матрицы может дать ±1 пиксель)
+    canvas = np.full((height, width), 255, dtype=np.float32)
+    h = min(height, image.shape[0])
+    w = min(width, image.shape[1])
+    canvas[:h, :w] = image[:h, :w]
+
+    cells = canvas.reshape(PHASH_SIZE, 8, PHASH_SIZE + 1, 8).mean(axis=(1, 3))
+    bits = (cells[:, 1:] > cells[:, :-1]).flatten()
+    return int(''.join('1' if bit else '0' for bit in bits), 2)
+
+
+def hamming_distance(hash_a, hash_b):
+    return bin(hash_a ^ hash_b).count('1')
+
+
+def file_digest(path):
+    """Хэш содержимого файла"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def masks_key(masks):
+    """Ключ набора масок (геометрия с точностью 0.01 pt)"""
+    return tuple(
+        (round(m['x'], 2), round(m['y'], 2), round(m['width'], 2), round(m['height'], 2))
+        for m in masks
+    )
+
+
+class FingerprintCache:
+    """
+    Кэш раскладок масок и результатов разделения по отпечаткам страниц
+
+    Результаты разделения переиспользуются только для точных дубликатов,
+    раскладки масок - и для почти одинаковых листов.
+    """
+
+    def __init__(self, max_distance=8):
+        self.max_distance = max_distance
+        self.plans = {}     # (отпечаток, параметры) -> маски
+        self.similar = {}   # параметры -> [(перцептивный хэш, размер, отпечаток)]
+        self.outputs = {}   # (отпечаток, ключ масок) -> [(путь, размер, хэш файла)]
+        self.hits = 0
+
+    def get_plan(self, fingerprint, params):
+        """Раскладка для страницы или почти такой же страницы"""
+        plan = self.plans.get((fingerprint['content'], params))
+        if plan is None and fingerprint.get('perceptual') is not None:
+            for phash, size, content in self.similar.get(params, []):
+                if (size == fingerprint['size'] and
+                        hamming_distance(phash, fingerprint['perceptual']) <= self.max_distance):
+                    plan = self.plans.get((content, params))
+                    break
+        if plan is None:
+            return None
+        self.hits += 1
+        return copy.deepcopy(plan)
+
+    def store_plan(self, fingerprint, params, masks):
+        self.plans[(fingerprint['content'], params)] = copy.deepcopy(masks)
+        if fingerprint.get('perceptual') is not None:
+            self.similar.setdefault(params, []).append(
+                (fingerprint['perceptual'], fingerprint['size'], fingerprint['content'])
+            )
+
+    def get_outputs(self, content, masks):
+        """Ранее созданные части для точно такой же страницы и масок"""
+        entries = self.outputs.get((content, masks_key(masks)))
+        if not entries:
+            return None
+        # Части могли быть перезаписаны другим разделением (в том числе
+        # файлом того же размера), поэтому сверяется содержимое
+        for path, size, digest in entries:
+            if (not os.path.exists(path) or os.path.getsize(path) != size or
+                    file_digest(path) != digest):
+                self.outputs.pop((content, masks_key(masks)), None)
+                return None
+        return [path for path, _, _ in entries]
+
+    def store_outputs(self, content, masks, output_files):
+        self.outputs[(content, masks_key(masks))] = [
+            (path, os.path.getsize(path), file_digest(path)) for path in output_files
+        ]
+
+    def reuse_outputs(self, content, masks, output_files):
+        """
+        Копирование ранее созданных частей под новыми именами
+
+        Returns:
+            bool: True если все части скопированы
+        """
+        cached = self.get_outputs(content, masks)
+        if cached is None or len(cached) != len(output_files):
+            return False
+        for source, target in zip(cached, output_files):
+            if os.path.abspath(source) != os.path.abspath(target):
+                shutil.copyfile(source, target)
+        self.hits += 1
+        return True
@@ -5,6 +5,13 @@ import fitz  # PyMuPDF
 from PySide6.QtGui import QPixmap, QImage
 import os
 
+from core.mask_templates import MaskTemplateStore
+from core.page_analysis import PageSpatialIndex
+from core.text_index import TextIndex
+from core.page_fingerprint import (FingerprintCache, content_hash, perceptual_hash,
+                                   masks_key)
+from core.image_split import find_scan_image
+
 
 class PDFHandler:
     """Класс для работы с PDF файлами"""
@@ -32,12 +39,29 @@ class PDFHandler:
         self.file_path = None
         self.page_count = 0
         self.current_page = None
+        # Шаблоны раскладки масок живут дольше документа:
+        # они применяются ко всем открываемым листам того же размера
+        self.mask_templates = MaskTemplateStore()
+        # Пространственные индексы страниц (строятся по запросу)
+        self.spatial_indexes = {}
+        # Кэш раскладок и частей для повторяющихся листов (между документами)
+        self.fingerprints = FingerprintCache()
+        self.page_fingerprints = {}
+        # Сканированные страницы (одно изображение на лист)
+        self.scan_images = {}
+        # Общий бюджет памяти рабочей области (если задан)
+        self.memory_budget = None
         
     def load_pdf(self, file_path):
         """Загрузка PDF файла"""
         try:
             self.document = fitz.open(file_path)
             self.file_path = file_path
+            if self.memory_budget is not None:
+                self.memory_budget.unregister_owner(self)
+            self.spatial_indexes = {}
+            self.page_fingerprints = {}
+            self.scan_images = {}
             self.page_count = len(self.document)
             
             if self.page_count > 0:
@@ -57,8 +81,14 @@ class PDFHandler:
             return None
         return self.document[page_num]
     
-    def render_page(self, page_num=0, zoom=2.0):
-        """Рендеринг страницы PDF в QPixmap"""
+    def render_image(self, page_num=0, zoom=2.0, clip=None):
+        """
+        Рендеринг страницы PDF в QImage
+        
+        Растр MuPDF копируется один раз - прямо в буфер, которым владеет
+        QImage (через samples_mv, без промежуточной копии bytes).
+        Pixmap MuPDF освобождается сразу после копирования.
+        """
         page = self.get_page(page_num)
         if not page:
             return None
@@ -67,21 +97,50 @@ class PDFHandler:
         mat = fitz.Matrix(zoom, zoom)
         
         # Рендерим страницу
-        pix = page.get_pixmap(matrix=mat)
-        
-        # Конвертируем в QImage
-        img_data = pix.samples
-        qimage = QImage(
-            img_data,
-            pix.width,
-            pix.height,
-            pix.stride,
-            QImage.Format_RGB888
-        )
+        pix = page.get_pixmap(matrix=mat, clip=clip, alpha=False)
+        
+        qimage = QImage(pix.width, pix.height, QImage.Format_RGB888)
+        dst = qimage.bits()
+        src = pix.samples_mv
+        dst_stride = qimage.bytesPerLine()
+        src_stride = pix.stride
+        
+        if dst_stride == src_stride:
+            dst[:len(src)] = src
+        else:
+            # Строки QImage выровнены по 4 байта - копируем построчно
+            for y in range(pix.height):
+                dst[y * dst_stride:y * dst_stride + src_stride] = \
+                    src[y * src_stride:(y + 1) * src_stride]
         
-        # Конвертируем в QPixmap
+        del dst, src, pix
+        
+        return qimage
+    
+    def render_page(self, page_num=0, zoom=2.0):
+        """Рендеринг страницы PDF в QPixmap"""
+        qimage = self.render_image(page_num, zoom)
+        if qimage is None:
+            return None
+        
+        # Однократная конвертация в родной формат растрового движка (RGB32):
+        # QPixmap в формате RGB888 конвертировался бы при каждой перерисовке
         return QPixmap.fromImage(qimage)
     
+    def render_overview(self, page_num=0, max_side=2048):
+        """
+        Рендеринг обзора страницы низкого разрешения
+        
+        Returns:
+            tuple: (QPixmap, zoom) или (None, None)
+        """
+        page = self.get_page(page_num)
+        if not page:
+            return None, None
+        
+        zoom = max_side / max(page.rect.width, page.rect.height)
+        return self.render_page(page_num, zoom=zoom), zoom
+    
     def get_page_size_mm(self, page_num=0):
         """Получение размера страницы в мм"""
         page = self.get_page(page_num)
@@ -219,7 +278,159 @@ class PDFHandler:
         
         return masks
     
-    def divide_pdf(self, masks, output_dir, page_num=0):
+    def plan_masks(self, page_num=0, overlap_percent=15, mask_format='A4',
+                   mask_landscape=False):
+        """
+        Маски для страницы с использованием шаблонов раскладки
+        
+        Для листов одного размера раскладка вычисляется один раз,
+        ручные правки пользователя применяются ко всем таким листам.
+        """
+        return self.mask_templates.get_masks(
+            self,
+            page_num=page_num,
+            overlap_percent=overlap_percent,
+            mask_format=mask_format,
+            mask_landscape=mask_landscape
+        )
+    
+    def get_template_key(self, page_num=0, overlap_percent=15, mask_format='A4',
+                         mask_landscape=False):
+        """Ключ шаблона раскладки для страницы"""
+        return self.mask_templates.make_key(
+            self, page_num, mask_format, mask_landscape, overlap_percent
+        )
+    
+    def get_spatial_index(self, page_num=0):
+        """Пространственный индекс текста и графики страницы (с кэшем)"""
+        if page_num not in self.spatial_indexes:
+            page = self.get_page(page_num)
+            if not page:
+                return None
+            index = PageSpatialIndex(page)
+            self.spatial_indexes[page_num] = index
+            if self.memory_budget is not None:
+                self.memory_budget.register(
+                    self, ('index', page_num), 'index', index.nbytes,
+                    lambda: self.spatial_indexes.pop(page_num, None)
+                )
+        return self.spatial_indexes[page_num]
+    
+    def get_page_fingerprint(self, page_num=0, perceptual=False):
+        """
+        Отпечаток страницы для поиска повторяющихся листов
+        
+        Args:
+            perceptual: вычислить также перцептивный хэш (требует рендера)
+        """
+        page = self.get_page(page_num)
+        if not page:
+            return None
+        
+        fingerprint = self.page_fingerprints.get(page_num)
+        if fingerprint is None:
+            fingerprint = {
+                'content': content_hash(self.document, page_num),
+                'perceptual': None,
+                'size': (round(page.rect.width), round(page.rect.height)),
+            }
+            self.page_fingerprints[page_num] = fingerprint
+        
+        if perceptual and fingerprint['perceptual'] is None:
+            fingerprint['perceptual'] = perceptual_hash(page)
+        
+        return fingerprint
+    
+    def snap_masks_to_seams(self, masks, page_num=0, overlap_percent=15):
+        """
+        Сдвиг масок сетки так, чтобы швы проходили через свободные зоны
+        
+        Каждая маска сдвигается не более чем на половину перекрытия,
+        поэтому соседние маски продолжают перекрываться и страница
+        остается покрытой полностью. Маски без позиции в сетке
+        (добавленные вручную) не сдвигаются.
+        
+        Returns:
+            list: новый список масок
+        """
+        # Для повторяющихся и почти одинаковых листов раскладка уже известна
+        fingerprint = self.get_page_fingerprint(page_num, perceptual=True)
+        if fingerprint is None:
+            return masks
+        plan_params = ('seams', masks_key(masks), round(float(overlap_percent), 2))
+        cached = self.fingerprints.get_plan(fingerprint, plan_params)
+        if cached is not None:
+            return cached
+        
+        index = self.get_spatial_index(page_num)
+        page_size = self.get_page_size_points(page_num)
+        if index is None or not page_size:
+            return masks
+        
+        page_width, page_height = page_size
+        overlap = overlap_percent / 100.0
+        snapped = []
+        
+        for mask in masks:
+            if 'row' not in mask or 'col' not in mask:
+                snapped.append(mask)
+                continue
+            
+            # Полный размер маски (крайние маски обрезаны по странице)
+            mask_width, mask_height = self.get_format_size_in_points(
+                mask.get('format', 'A4'))
+            if mask.get('is_landscape'):
+                mask_width, mask_height = mask_height, mask_width
+            
+            max_dx = mask_width * overlap / 2
+            max_dy = mask_height * overlap / 2
+            x, y = mask['x'], mask['y']
+            
+            # Первый столбец/строка остаются у края страницы,
+            # последние - не открывают противоположный край
+            dx_range = [0.0, 0.0] if mask['col'] == 0 else [-max_dx, max_dx]
+            dy_range = [0.0, 0.0] if mask['row'] == 0 else [-max_dy, max_dy]
+            if x + mask_width >= page_width:
+                dx_range[0] = max(dx_range[0], page_width - x - mask_width)
+            if y + mask_height >= page_height:
+                dy_range[0] = max(dy_range[0], page_height - y - mask_height)
+            
+            new_x, new_y = index.snap_mask(x, y, mask_width, mask_height,
+                                           dx_range, dy_range)
+            
+            new_x, new_y = max(0.0, new_x), max(0.0, new_y)
+            
+            mask = dict(mask)
+            mask['x'] = new_x
+            mask['y'] = new_y
+            mask['width'] = min(mask_width, page_width - new_x)
+            mask['height'] = min(mask_height, page_height - new_y)
+            snapped.append(mask)
+        
+        self.fingerprints.store_plan(fingerprint, plan_params, snapped)
+        return snapped
+    
+    def get_scan_image(self, page_num=0):
+        """
+        Изображение скана, занимающее всю страницу
+        
+        Returns:
+            ScanImage или None, если страница не является сканом
+        """
+        if page_num not in self.scan_images:
+            page = self.get_page(page_num)
+            self.scan_images[page_num] = find_scan_image(page) if page else None
+        return self.scan_images[page_num]
+    
+    def _insert_scan_part(self, scan, new_page, mask):
+        """Вставка фрагмента скана; False - использовать обычное копирование"""
+        try:
+            return scan.insert_part(new_page, mask)
+        except Exception:
+            return False
+    
+    def divide_pdf(self, masks, output_dir, page_num=0, part_numbers=None,
+                   build_index=False, base_name=None):
         """
         Разделение PDF на части согласно маскам
         
@@ -227,6 +438,9 @@ class PDFHandler:
             masks: список данных масок
             output_dir: директория для сохранения
             page_num: номер страницы
+            part_numbers: номера частей для имен файлов (по умолчанию 1..N)
+            build_index: сохранить текстовый индекс частей рядом с ними
+            base_name: начало имен файлов (по умолчанию - имя документа)
         
         Returns:
             list: список путей к созданным файлам
@@ -238,10 +452,33 @@ class PDFHandler:
         if not page:
             raise Exception(f"Страница {page_num} не найдена")
         
-        output_files = []
-        base_name = os.path.splitext(os.path.basename(self.file_path))[0]
+        if base_name is None:
+            base_name = os.path.splitext(os.path.basename(self.file_path))[0]
+        if part_numbers is None:
+            part_numbers = range(1, len(masks) + 1)
+        output_files = [
+            os.path.join(output_dir, f"{base_name}_part_{i:03d}.pdf")
+            for i in part_numbers
+        ]
+        
+        if build_index:
+            text_index = TextIndex.for_directory(output_dir)
+            try:
+                text_index.add_page(page, masks, output_files, self.file_path, page_num)
+            finally:
+                text_index.close()
+        
+        # Такой же лист уже разделялся с теми же масками - копируем части
+        content = self.get_page_fingerprint(page_num)['content']
+        if self.fingerprints.reuse_outputs(content, masks, output_files):
+            return output_files
         
-        for i, mask in enumerate(masks, 1):
+        # Скан разделяется вырезанием фрагментов изображения: каждая часть
+        # получает только свои пиксели, а не весь скан целиком
+        scan = self.get_scan_image(page_num)
+        
+        source_rect = self.document[page_num].rect
+        for mask, output_file in zip(masks, output_files):
             # Создаем новый PDF документ
             output_pdf = fitz.open()
             
@@ -260,28 +497,29 @@ class PDFHandler:
                 mask['y'] + mask['height']
             )
             
-            # Целевая область (вся новая страница)
-            dest_rect = fitz.Rect(0, 0, mask['width'], mask['height'])
+            # Целевая область - видимая часть маски на своем месте в части
+            # (маска, выходящая за край страницы, не растягивает содержимое)
+            src_rect &= source_rect
+            dest_rect = src_rect + (-mask['x'], -mask['y'], -mask['x'], -mask['y'])
             
             # Копируем содержимое с сохранением качества
-            new_page.show_pdf_page(
-                dest_rect,
-                self.document,
-                page_num,
-                clip=src_rect
-            )
+            if scan is None or not self._insert_scan_part(scan, new_page, mask):
+                if not src_rect.is_empty:
+                    new_page.show_pdf_page(
+                        dest_rect,
+                        self.document,
+                        page_num,
+                        clip=src_rect
+                    )
             
-            # Сохраняем файл
-            output_file = os.path.join(
-                output_dir,
-                f"{base_name}_part_{i:03d}.pdf"
-            )
-            
-            output_pdf.save(output_file)
+            # Сохраняем файл (фрагменты скана вставляются несжатыми)
+            output_pdf.save(output_file, deflate=scan is not None)
             output_pdf.close()
-            
-            output_files.append(output_file)
         
+        if scan is not None:
+            scan.release()
+        
+        self.fingerprints.store_outputs(content, masks, output_files)
         return output_files
     
     def close(self):
@@ -292,4 +530,9 @@ class PDFHandler:
             self.file_path = None
             self.page_count = 0
             self.current_page = None
+            if self.memory_budget is not None:
+                self.memory_budget.unregister_owner(self)
+            self.spatial_indexes = {}
+            self.page_fingerprints = {}
+            self.scan_images = {}
 
@@ -0,0 +1,125 @@
+"""
+Общие ресурсы открытых документов
+
+Все документы рабочей области используют один пул процессов и один
+бюджет памяти для растров и кэшей. При превышении бюджета первыми
+освобождаются растры неактивных вкладок, затем их кэши; отображаемые
+растры активной вкладки не освобождаются.
+"""
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+
+class MemoryBudget:
+    """Бюджет памяти для растров и кэшей нескольких документов"""
+
+    # Порядок освобождения: полный растр пересоздается быстрее всего,
+    # обзор нужен для отображения вкладки - освобождается последним
+    RELEASE_ORDER = {'full': 0, 'cache': 1, 'index': 2, 'overview': 3}
+    # У активного документа освобождаются только неотображаемые данные
+    ACTIVE_RELEASABLE = {'cache'}
+
+    def __init__(self, limit_mb=2048):
+        # 0 - без ограничения
+        self.limit_bytes = int(limit_mb * 1024 * 1024)
+        self.entries = {}
+        self.active_owners = set()
+        self.released = 0
+
+    @property
+    def used_bytes(self):
+        return sum(entry['nbytes'] for entry in self.entries.values())
+
+    def register(self, owner, key, kind, nbytes, release):
+        """
+        Учет растра или кэша
+
+        Args:
+            owner: документ-владелец (вкладка, обработчик)
+            key: ключ записи в пределах владельца
+            kind: 'full', 'overview', 'cache' или 'index'
+            nbytes: занимаемая память
+            release: функция освобождения
+        """
+        self.entries[(id(owner), key)] = {
+            'owner': owner,
+            'kind': kind,
+            'nbytes': int(nbytes),
+            'release': release,
+            'used': time.monotonic(),
+        }
+        self.enforce()
+
+    def unregister(self, owner, key):
+        self.entries.pop((id(owner), key), None)
+
+    def unregister_owner(self, owner):
+        """Удаление всех записей владельца (документ закрыт или перезагружен)"""
+        for entry_key in [k for k, e in self.entries.items() if e['owner'] is owner]:
+            del self.entries[entry_key]
+
+    def touch(self, owner, key):
+        entry = self.entries.get((id(owner), key))
+        if entry:
+            entry['used'] = time.monotonic()
+
+    def set_active(self, *owners):
+        """Смена активного документа (вкладки)"""
+        self.active_owners = set(owners)
+        now = time.monotonic()
+        for entry in self.entries.values():
+            if entry['owner'] in self.active_owners:
+                entry['used'] = now
+        self.enforce()
+
+    def _releasable(self):
+        candidates = []
+        for entry_key, entry in self.entries.items():
+            active = entry['owner'] in self.active_owners
+            if active and entry['kind'] not in self.ACTIVE_RELEASABLE:
+                continue
+            candidates.append((active, self.RELEASE_ORDER.get(entry['kind'], 0),
+                               entry['used'], entry_key))
+        # Сначала неактивные документы, внутри - по порядку освобождения и давности
+        candidates.sort(key=lambda candidate: candidate[:3])
+        return [entry_key for _, _, _, entry_key in candidates]
+
+    def enforce(self):
+        """Освобождение данных до укладывания в бюджет"""
+        used = self.used_bytes
+        if self.limit_bytes <= 0 or used <= self.limit_bytes:
+            return 0
+
+        freed = 0
+        for entry_key in self._releasable():
+            if used - freed <= self.limit_bytes:
+                break
+            entry = self.entries.pop(entry_key, None)
+            if entry is None:
+                continue
+            entry['release']()
+            freed += entry['nbytes']
+            self.released += 1
+        return freed
+
+
+class ResourceManager:
+    """Пул процессов и бюджет памяти рабочей области"""
+
+    def __init__(self, memory_limit_mb=2048, workers=None):
+        self.workers = workers or max(1, (os.cpu_count() or 2) - 1)
+        self.memory_budget = MemoryBudget(memory_limit_mb)
+        self._executor = None
+
+    @property
+    def executor(self):
+        """Общий пул процессов (создается при первом обращении)"""
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
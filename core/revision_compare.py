@@ -0,0 +1,201 @@
+"""
+Сравнение редакций чертежа и повторное разделение измененных частей
+
+Если содержимое страниц различается, сравниваются текстовые фрагменты
+(измененный размер или надпись находится точно, даже мелким шрифтом)
+и растры страниц: плитка считается измененной, если в ней есть хотя бы
+один заметно отличающийся пиксель. Измененные области пересекаются
+с масками - заново разделяются только затронутые части.
+"""
+import os
+import re
+
+import fitz  # PyMuPDF
+import numpy as np
+
+from core.page_analysis import collect_text_spans
+from core.page_fingerprint import content_hash
+from core.split_verifier import render_gray, cells_to_regions
+
+
+PART_NAME_RE = re.compile(r'^(.+)_part_\d{3,}\.pdf$')
+
+
+def tile_max(diff, tile_px):
+    """Наибольшая разница по плиткам tile_px × tile_px"""
+    height, width = diff.shape
+    rows = -(-height // tile_px)
+    cols = -(-width // tile_px)
+    padded = np.zeros((rows * tile_px, cols * tile_px), dtype=diff.dtype)
+    padded[:height, :width] = diff
+    return padded.reshape(rows, tile_px, cols, tile_px).max(axis=(1, 3))
+
+
+def changed_text_regions(old_page, new_page, precision=0.5):
+    """
+    Текстовые фрагменты, которые есть только в одной из редакций
+
+    Returns:
+        list: прямоугольники (x0, y0, x1, y1) в points
+    """
+    def spans(page):
+        boxes, texts = collect_text_spans(page)
+        return {
+            (text, *(round(value / precision) for value in box)): tuple(box)
+            for box, text in zip(boxes.tolist(), texts)
+        }
+
+    old_spans = spans(old_page)
+    new_spans = spans(new_page)
+    changed = old_spans.keys() ^ new_spans.keys()
+    # Замененный фрагмент дает одинаковый прямоугольник в обеих редакциях
+    return list(dict.fromkeys(
+        old_spans.get(key) or new_spans[key] for key in sorted(changed)
+    ))
+
+
+def find_changed_regions(old_path, new_path, old_page=0, new_page=0, dpi=72,
+                         tile_px=8, threshold=48):
+    """
+    Поиск измененных областей страницы
+
+    Args:
+        old_path: путь к старой редакции
+        new_path: путь к новой редакции
+        dpi: разрешение сравнения
+        tile_px: размер плитки сравнения в пикселях
+        threshold: минимальная разница яркости пикселя (0-255)
+
+    Returns:
+        list: прямоугольники (x0, y0, x1, y1) в points новой страницы
+    """
+    old_doc = fitz.open(old_path)
+    new_doc = fitz.open(new_path)
+    try:
+        # Одинаковое содержимое - сравнивать растры не нужно
+        if content_hash(old_doc, old_page) == content_hash(new_doc, new_page):
+            return []
+
+        text_regions = changed_text_regions(old_doc[old_page], new_doc[new_page])
+
+        zoom = dpi / 72.0
+        matrix = fitz.Matrix(zoom, zoom)
+        old_image, _, _ = render_gray(old_doc[old_page], matrix)
+        new_image, _, _ = render_gray(new_doc[new_page], matrix)
+        page_rect = new_doc[new_page].rect
+    finally:
+        old_doc.close()
+        new_doc.close()
+
+    # Листы могут отличаться размером: сравниваем на общем белом холсте
+    height = max(old_image.shape[0], new_image.shape[0])
+    width = max(old_image.shape[1], new_image.shape[1])
+    old_canvas = np.full((height, width), 255, dtype=np.int16)
+    new_canvas = np.full((height, width), 255, dtype=np.int16)
+    old_canvas[:old_image.shape[0], :old_image.shape[1]] = old_image
+    new_canvas[:new_image.shape[0], :new_image.shape[1]] = new_image
+
+    # Мелкая правка (цифра размера) меняет лишь несколько пикселей,
+    # поэтому плитка оценивается по наибольшей, а не средней разнице
+    changed = tile_max(np.abs(new_canvas - old_canvas), tile_px) > threshold
+    if not changed.any():
+        return text_regions
+
+    return text_regions + cells_to_regions(changed, tile_px / zoom,
+                                           max(page_rect.width, width / zoom),
+                                           max(page_rect.height, height / zoom))
+
+
+def affected_masks(masks, regions):
+    """
+    Номера масок (с 0), пересекающихся с измененными областями
+    """
+    if not masks or not regions:
+        return []
+
+    boxes = np.array([
+        (m['x'], m['y'], m['x'] + m['width'], m['y'] + m['height'])
+        for m in masks
+    ], dtype=np.float64)
+    areas = np.array(regions, dtype=np.float64)
+
+    # Матрица пересечений маски × области
+    hits = (
+        (boxes[:, None, 0] < areas[None, :, 2]) & (boxes[:, None, 2] > areas[None, :, 0]) &
+        (boxes[:, None, 1] < areas[None, :, 3]) & (boxes[:, None, 3] > areas[None, :, 1])
+    )
+    return [int(i) for i in np.flatnonzero(hits.any(axis=1))]
+
+
+def existing_base_name(output_dir, candidates=()):
+    """
+    Начало имен частей из candidates, уже лежащих в папке (<имя>_part_NNN.pdf)
+
+    Чужие комплекты в той же папке не учитываются: их части не должны
+    перезаписываться частями этого документа.
+
+    Args:
+        candidates: возможные имена (проверяются по порядку)
+
+    Returns:
+        str или None, если частей ни с одним из имен в папке нет
+    """
+    if not os.path.isdir(output_dir):
+        return None
+    prefixes = set()
+    for name in os.listdir(output_dir):
+        match = PART_NAME_RE.match(name)
+        if match:
+            prefixes.add(match.group(1))
+    for candidate in candidates:
+        if candidate in prefixes:
+            return candidate
+    return None
+
+
+def resplit_changed(pdf_handler, old_path, masks, output_dir, page_num=0,
+                    old_page=None, base_name=None, **compare_options):
+    """
+    Повторное разделение только измененных частей новой редакции
+
+    Номера частей и начало имен файлов берутся из уже разделенного
+    комплекта (part_NNN соответствует маске NNN), поэтому новые файлы
+    заменяют устаревшие части, а не ложатся рядом с ними.
+
+    Args:
+        pdf_handler: обработчик с загруженной новой редакцией
+        old_path: путь к старой редакции
+        masks: текущие маски
+        base_name: начало имен частей (по умолчанию - из файлов в output_dir)
+
+    Returns:
+        dict: {'regions': области, 'indices': номера масок (с 0), 'files': новые файлы}
+    """
+    if not pdf_handler.is_loaded():
+        raise Exception("PDF не загружен")
+
+    regions = find_changed_regions(
+        old_path, pdf_handler.file_path,
+        old_page=page_num if old_page is None else old_page,
+        new_page=page_num,
+        **compare_options
+    )
+    indices = affected_masks(masks, regions)
+
+    if base_name is None:
+        base_name = existing_base_name(output_dir, [
+            os.path.splitext(os.path.basename(old_path))[0],
+            os.path.splitext(os.path.basename(pdf_handler.file_path))[0],
+        ])
+
+    files = []
+    if indices:
+        files = pdf_handler.divide_pdf(
+            [masks[i] for i in indices],
+            output_dir,
+            page_num,
+            part_numbers=[i + 1 for i in indices],
+            base_name=base_name
+        )
+
+    return {'regions': regions, 'indices': indices, 'files': files}
@@ -0,0 +1,467 @@
+"""
+Планировщик параллельного разделения с оценкой стоимости страниц
+
+Перед разделением стоимость каждой страницы оценивается без рендеринга:
+объем потока содержимого, количество операторов, объем изображений и
+количество частей. show_pdf_page копирует в каждую часть все содержимое
+страницы, поэтому стоимость растет как (число частей × сложность листа).
+Скан делится вырезанием фрагментов: каждое задание декодирует изображение
+целиком, а части кодируют свои фрагменты - стоимость зависит от размера
+изображения.
+
+Задания отправляются в пул от самых дорогих к самым дешевым (LPT),
+тяжелые страницы делятся на диапазоны частей между процессами.
+После выполнения сравниваются прогноз и фактическое время.
+"""
+import heapq
+import math
+import os
+import re
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import fitz  # PyMuPDF
+
+from core.image_split import find_scan_image
+from core.page_fingerprint import masks_key
+from core.pdf_handler import PDFHandler
+from core.text_index import TextIndex
+
+
+# Операторы потока содержимого: короткие слова, не являющиеся именами (/Name)
+# и числами. Подсчет приблизительный (учитывает и слова внутри строк текста)
+OPERATOR_PATTERN = re.compile(rb'(?<![/\w.])[A-Za-z\'"][A-Za-z0-9*\'"]{0,2}(?!\w)')
+
+
+def _stream_length(document, xref):
+    kind, value = document.xref_get_key(xref, 'Length')
+    return int(value) if kind == 'int' else 0
+
+
+def _image_components(document, xref, colorspace):
+    """Количество цветовых компонент изображения"""
+    if colorspace == 'ICCBased':
+        # Число компонент записано в потоке профиля (/N)
+        kind, value = document.xref_get_key(xref, 'ColorSpace')
+        if kind == 'xref':
+            value = document.xref_object(int(value.split()[0]))
+        match = re.search(r'/ICCBased\s+(\d+) 0 R', value)
+        if match:
+            kind, components = document.xref_get_key(int(match.group(1)), 'N')
+            if kind == 'int':
+                return int(components)
+    return {'DeviceGray': 1, 'DeviceCMYK': 4}.get(colorspace, 3)
+
+
+def _image_bytes(document, image):
+    """Объем несжатых пикселей изображения (запись get_images)"""
+    xref, width, height, bpc = image[0], image[2], image[3], image[4]
+    components = _image_components(document, xref, image[5])
+    return width * height * components * max(bpc, 1) // 8
+
+
+def estimate_page(document, page_num, tiles):
+    """
+    Характеристики страницы для оценки стоимости разделения
+
+    Returns:
+        dict: content_bytes, operators, image_bytes, tiles, scan
+              (scan - описание скана или None)
+    """
+    page = document[page_num]
+    content = page.read_contents()
+
+    # Формы (XObject) входят в содержимое, но не в поток страницы
+    content_bytes = len(content)
+    for xref, *_ in page.get_xobjects():
+        content_bytes += _stream_length(document, xref)
+
+    images = page.get_images(full=True)
+    scan = None
+    if find_scan_image(page) is not None:
+        # Скан не копируется в части целиком - его стоимость считается отдельно
+        scan = {
+            'pixels': images[0][2] * images[0][3],
+            'bytes': _image_bytes(document, images[0]),
+            'jpeg': 'DCTDecode' in images[0][8],
+        }
+        images = []
+
+    # Изображения - по объему несжатых пикселей
+    image_bytes = sum(_image_bytes(document, image) for image in images)
+
+    return {
+        'content_bytes': content_bytes,
+        'operators': len(OPERATOR_PATTERN.findall(content)),
+        'image_bytes': image_bytes,
+        'tiles': tiles,
+        'scan': scan,
+    }
+
+
+class CostModel:
+    """Оценка длительности разделения, сек"""
+
+    # Постоянные затраты на одно задание (открытие документа в процессе)
+    TASK_OVERHEAD_S = 0.05
+    # Затраты на одну часть
+    TILE_BASE_S = 0.001
+    PER_CONTENT_BYTE_S = 0.18e-6
+    PER_OPERATOR_S = 2.0e-6
+    PER_IMAGE_BYTE_S = 0.5e-9
+    # Скан: декодирование (в каждом задании) и кодирование фрагментов
+    # (PNG - по пикселям и несжатому объему, JPEG - по пикселям)
+    SCAN_DECODE_PIXEL_S = 5e-9
+    SCAN_PIXEL_S = 20e-9
+    SCAN_BYTE_S = 80e-9
+    SCAN_JPEG_PIXEL_S = 15e-9
+
+    def __init__(self):
+        # Поправочный коэффициент по фактическим замерам
+        self.scale = 1.0
+
+    def tile_cost(self, features):
+        return (self.TILE_BASE_S +
+                features['content_bytes'] * self.PER_CONTENT_BYTE_S +
+                features['operators'] * self.PER_OPERATOR_S +
+                features['image_bytes'] * self.PER_IMAGE_BYTE_S)
+
+    def scan_encode_cost(self, scan):
+        """Кодирование фрагментов всех частей скана"""
+        if scan['jpeg']:
+            return scan['pixels'] * self.SCAN_JPEG_PIXEL_S
+        return scan['pixels'] * self.SCAN_PIXEL_S + scan['bytes'] * self.SCAN_BYTE_S
+
+    def estimate(self, features, tiles=None):
+        """Оценка без поправочного коэффициента"""
+        tiles = features['tiles'] if tiles is None else tiles
+        cost = self.TASK_OVERHEAD_S + tiles * self.tile_cost(features)
+        scan = features.get('scan')
+        if scan and features['tiles']:
+            cost += scan['pixels'] * self.SCAN_DECODE_PIXEL_S
+            cost += self.scan_encode_cost(scan) * tiles / features['tiles']
+        return cost
+
+    def predict(self, features, tiles=None):
+        return self.estimate(features, tiles) * self.scale
+
+    def calibrate(self, estimate, actual, weight=0.3):
+        """Уточнение коэффициента по выполненному заданию"""
+        if estimate > 0 and actual > 0:
+            self.scale = (1 - weight) * self.scale + weight * actual / estimate
+
+
+class SplitTask:
+    """Диапазон частей одной страницы, выполняемый одним процессом"""
+
+    def __init__(self, source_path, page_num, masks, part_numbers, output_dir, features):
+        self.source_path = source_path
+        self.page_num = page_num
+        self.masks = masks
+        self.part_numbers = part_numbers
+        self.output_dir = output_dir
+        self.features = features
+        # Оценка модели и прогноз с поправкой по прошлым замерам
+        self.estimate = 0.0
+        self.predicted = 0.0
+        self.actual = None
+        self.files = []
+        self.error = None
+
+
+def _split_task(source_path, page_num, masks, output_dir, part_numbers):
+    """
+    Разделение диапазона частей страницы (выполняется в дочернем процессе)
+
+    Returns:
+        tuple: (список файлов, время выполнения)
+    """
+    started = time.perf_counter()
+    handler = PDFHandler()
+    handler.load_pdf(source_path)
+    try:
+        files = handler.divide_pdf(masks, output_dir, page_num, part_numbers=part_numbers)
+    finally:
+        handler.close()
+    return files, time.perf_counter() - started
+
+
+def page_output_dir(output_dir, source_path, page_num, separate_documents=False):
+    """Папка частей страницы: page_NNN (в подпапке документа, если их несколько)"""
+    if separate_documents:
+        stem = os.path.splitext(os.path.basename(source_path))[0]
+        output_dir = os.path.join(output_dir, stem)
+    return os.path.join(output_dir, f"page_{page_num + 1:03d}")
+
+
+class SplitScheduler:
+    """Параллельное разделение страниц от самых дорогих к самым дешевым"""
+
+    def __init__(self, workers=None, executor=None, model=None):
+        self.workers = workers or max(1, os.cpu_count() or 1)
+        self.executor = executor
+        self.model = model or CostModel()
+        # Страницы: (путь, номер страницы, маски, папка, характеристики)
+        self.pages = []
+        # (путь, номер страницы) -> (отпечаток содержимого, ключ масок)
+        self.page_keys = {}
+        # Одинаковые листы: (страница, (путь, номер) делящейся страницы)
+        self.duplicates = []
+
+    def add_page(self, source_path, page_num, masks, output_dir, features,
+                 content=None):
+        """
+        Добавление страницы
+
+        Args:
+            content: отпечаток содержимого (content_hash); одинаковые листы
+                с одинаковыми масками делятся один раз
+        """
+        if masks:
+            self.pages.append((source_path, page_num, masks, output_dir, features))
+            if content is not None:
+                self.page_keys[(source_path, page_num)] = (content, masks_key(masks))
+
+    def add_document(self, pdf_handler, output_dir, overlap_percent=15, mask_format='A4',
+                     mask_landscape=False, pages=None, masks_by_page=None,
+                     separate_documents=False):
+        """
+        Добавление страниц документа (маски - из шаблонов раскладки)
+
+        Args:
+            pdf_handler: обработчик с загруженным документом
+            masks_by_page: готовые маски для отдельных страниц (номер -> маски)
+            separate_documents: части документа в отдельной подпапке
+        """
+        masks_by_page = masks_by_page or {}
+        pages = range(pdf_handler.page_count) if pages is None else pages
+        for page_num in pages:
+            masks = masks_by_page.get(page_num)
+            if masks is None:
+                masks = pdf_handler.plan_masks(
+                    page_num=page_num,
+                    overlap_percent=overlap_percent,
+                    mask_format=mask_format,
+                    mask_landscape=mask_landscape
+                )
+            features = estimate_page(pdf_handler.document, page_num, len(masks))
+            self.add_page(
+                pdf_handler.file_path, page_num, masks,
+                page_output_dir(output_dir, pdf_handler.file_path, page_num,
+                                separate_documents),
+                features,
+                content=pdf_handler.get_page_fingerprint(page_num)['content']
+            )
+
+    def _unique_pages(self):
+        """
+        Страницы для разделения без повторов
+
+        Лист с тем же содержимым и теми же масками, что у уже добавленного,
+        не делится: его части копируются после выполнения (self.duplicates).
+        """
+        unique = []
+        self.duplicates = []
+        first_by_key = {}
+        for page in self.pages:
+            page_key = page[:2]
+            key = self.page_keys.get(page_key)
+            if key is not None and key in first_by_key:
+                self.duplicates.append((page, first_by_key[key]))
+                continue
+            if key is not None:
+                first_by_key[key] = page_key
+            unique.append(page)
+        return unique
+
+    def plan(self):
+        """
+        Разбиение на задания и порядок отправки
+
+        Страница дороже среднего объема работы на процесс делится на
+        диапазоны частей, чтобы один тяжелый лист не определял общее время.
+        Одинаковые листы дают задания только один раз.
+
+        Returns:
+            list: задания по убыванию прогнозируемой стоимости
+        """
+        pages = self._unique_pages()
+        total = sum(self.model.predict(features) for *_, features in pages)
+        target = total / self.workers if self.workers > 1 else math.inf
+
+        tasks = []
+        for source_path, page_num, masks, output_dir, features in pages:
+            cost = self.model.predict(features)
+            chunks = 1
+            if cost > target:
+                chunks = min(len(masks), self.workers, math.ceil(cost / target))
+            numbers = list(range(1, len(masks) + 1))
+            for i in range(chunks):
+                indices = numbers[i * len(numbers) // chunks:
+                                  (i + 1) * len(numbers) // chunks]
+                task = SplitTask(source_path, page_num, [masks[n - 1] for n in indices],
+                                 indices, output_dir, features)
+                task.estimate = self.model.estimate(features, len(indices))
+                task.predicted = task.estimate * self.model.scale
+                tasks.append(task)
+
+        tasks.sort(key=lambda task: task.predicted, reverse=True)
+        return tasks
+
+    def predicted_makespan(self, tasks):
+        """Прогноз общего времени при жадном распределении по процессам"""
+        loads = [0.0] * min(self.workers, max(1, len(tasks)))
+        for task in tasks:
+            heapq.heapreplace(loads, loads[0] + task.predicted)
+        return max(loads) if loads else 0.0
+
+    def run(self, build_index=False, progress_callback=None, index_dir=None):
+        """
+        Выполнение разделения
+
+        Args:
+            build_index: построить текстовый индекс частей
+            index_dir: папка индекса (по умолчанию - общая папка всех частей)
+
+        Returns:
+            dict: отчет с заданиями, файлами по страницам, прогнозом и фактом
+        """
+        tasks = self.plan()
+        predicted_makespan = self.predicted_makespan(tasks)
+        started = time.perf_counter()
+
+        own_executor = self.executor is None
+        executor = ProcessPoolExecutor(max_workers=self.workers) if own_executor \
+            else self.executor
+        try:
+            # Пул выполняет задания в порядке отправки - сначала самые дорогие
+            futures = {}
+            for task in tasks:
+                os.makedirs(task.output_dir, exist_ok=True)
+                future = executor.submit(_split_task, task.source_path, task.page_num,
+                                         task.masks, task.output_dir, task.part_numbers)
+                futures[future] = task
+
+            for done, future in enumerate(as_completed(futures), 1):
+                task = futures[future]
+                try:
+                    task.files, task.actual = future.result()
+                    self.model.calibrate(task.estimate, task.actual)
+                except Exception as e:
+                    task.error = str(e)
+                if progress_callback:
+                    progress_callback(done, len(tasks))
+        finally:
+            if own_executor:
+                executor.shutdown()
+
+        files = {}
+        for task in sorted(tasks, key=lambda t: (t.source_path, t.page_num,
+                                                 t.part_numbers[0])):
+            files.setdefault((task.source_path, task.page_num), []).extend(task.files)
+        copies = self._copy_duplicates(tasks, files)
+
+        if build_index and files:
+            if index_dir is None:
+                index_dir = os.path.commonpath([
+                    os.path.dirname(os.path.abspath(output_dir))
+                    for _, _, _, output_dir, _ in self.pages
+                ])
+            self._build_index(files, index_dir)
+
+        return {
+            'tasks': tasks,
+            'files': files,
+            'errors': [task for task in tasks if task.error],
+            'copies': copies,
+            'predicted': predicted_makespan,
+            'actual': time.perf_counter() - started,
+            'workers': self.workers,
+        }
+
+    def _copy_duplicates(self, tasks, files):
+        """
+        Копирование частей разделенного листа в папки его повторов
+
+        Части получают имена по документу повтора и те же номера.
+
+        Returns:
+            int: количество листов, получивших копии
+        """
+        parts_by_page = {}
+        for task in tasks:
+            numbered = zip(task.part_numbers, task.files)
+            parts_by_page.setdefault((task.source_path, task.page_num), []).extend(numbered)
+
+        copies = 0
+        for (source_path, page_num, _, output_dir, _), original in self.duplicates:
+            parts = parts_by_page.get(original)
+            if not parts:
+                continue
+            os.makedirs(output_dir, exist_ok=True)
+            base_name = os.path.splitext(os.path.basename(source_path))[0]
+            copied = []
+            for part_number, path in sorted(parts):
+                target = os.path.join(output_dir, f"{base_name}_part_{part_number:03d}.pdf")
+                if os.path.abspath(target) != os.path.abspath(path):
+                    shutil.copyfile(path, target)
+                copied.append(target)
+            files[(source_path, page_num)] = copied
+            copies += 1
+        return copies
+
+    def _build_index(self, files, index_dir):
+        """
+        Один текстовый индекс для всех страниц (в основном процессе: SQLite
+        не любит одновременную запись из нескольких процессов)
+        """
+        masks_by_page = {
+            (source_path, page_num): masks
+            for source_path, page_num, masks, _, _ in self.pages
+        }
+        documents = {}
+        text_index = TextIndex.for_directory(index_dir)
+        try:
+            for (source_path, page_num), output_files in files.items():
+                masks = masks_by_page[(source_path, page_num)]
+                if len(output_files) != len(masks):
+                    continue
+                if source_path not in documents:
+                    documents[source_path] = fitz.open(source_path)
+                page = documents[source_path][page_num]
+                text_index.add_page(page, masks, output_files, source_path, page_num)
+        finally:
+            text_index.close()
+            for document in documents.values():
+                document.close()
+
+
+def format_schedule_report(report, max_items=10):
+    """Текстовый отчет: прогноз и фактическое время"""
+    tasks = report['tasks']
+    total_files = sum(len(files) for files in report['files'].values())
+    lines = [
+        f"Страниц: {len(report['files'])}, заданий: {len(tasks)}, "
+        f"процессов: {report['workers']}",
+        f"Создано файлов: {total_files}" + (
+            f" (листов-повторов скопировано: {report['copies']})"
+            if report.get('copies') else ""),
+        f"Время: прогноз {report['predicted']:.1f} с, факт {report['actual']:.1f} с",
+    ]
+
+    finished = [task for task in tasks if task.actual is not None]
+    if finished:
+        lines.append("Самые тяжелые задания (прогноз / факт):")
+        for task in sorted(finished, key=lambda t: t.actual, reverse=True)[:max_items]:
+            name = os.path.basename(task.source_path)
+            lines.append(
+                f"  {name}, стр. {task.page_num + 1}, части "
+                f"{task.part_numbers[0]}-{task.part_numbers[-1]}: "
+                f"{task.predicted:.2f} / {task.actual:.2f} с"
+            )
+
+    for task in report['errors'][:max_items]:
+        lines.append(f"Ошибка: {os.path.basename(task.source_path)}, "
+                     f"стр. {task.page_num + 1}: {task.error}")
+    return "\n".join(lines)
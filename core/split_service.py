@@ -0,0 +1,559 @@
+"""
+Локальный HTTP-сервис разделения PDF чертежей
+
+Позволяет внешним системам (PLM, портал печати) разделять чертежи без GUI.
+Фронтенд на asyncio принимает запросы, тяжелая работа (generate_masks /
+divide_pdf) выполняется в пуле процессов с ограниченной очередью.
+
+API:
+    POST /split                 тело - PDF (application/pdf) или JSON {"path": ...}
+                                параметры: page, format, landscape, overlap, wait
+    GET  /jobs/<id>             статус задания (JSON)
+    GET  /jobs/<id>/result      ZIP с частями
+    GET  /health                состояние сервиса
+"""
+import asyncio
+import hashlib
+import itertools
+import json
+import os
+import shutil
+import tempfile
+import uuid
+import zipfile
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import quote, urlsplit, parse_qs
+
+from core.pdf_handler import PDFHandler
+
+
+HTTP_REASONS = {
+    200: 'OK',
+    202: 'Accepted',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    409: 'Conflict',
+    413: 'Payload Too Large',
+    500: 'Internal Server Error',
+    503: 'Service Unavailable',
+}
+
+
+def _split_worker(source_path, params, output_dir):
+    """
+    Разделение страницы в дочернем процессе
+
+    Returns:
+        str: путь к ZIP архиву с частями
+    """
+    handler = PDFHandler()
+    handler.load_pdf(source_path)
+    try:
+        masks = handler.generate_masks(
+            page_num=params['page'],
+            overlap_percent=params['overlap'],
+            mask_format=params['format'],
+            mask_landscape=params['landscape']
+        )
+        parts_dir = os.path.join(output_dir, 'parts')
+        os.makedirs(parts_dir, exist_ok=True)
+        output_files = handler.divide_pdf(masks, parts_dir, params['page'])
+    finally:
+        handler.close()
+
+    zip_path = os.path.join(output_dir, 'result.zip')
+    # Части PDF уже сжаты, повторное сжатие только тратит время
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_STORED) as archive:
+        for output_file in output_files:
+            archive.write(output_file, os.path.basename(output_file))
+    shutil.rmtree(parts_dir, ignore_errors=True)
+
+    return zip_path
+
+
+def _estimate_tiles(source_path, params):
+    """Быстрая оценка количества частей (без рендеринга)"""
+    handler = PDFHandler()
+    handler.load_pdf(source_path)
+    try:
+        if params['page'] >= handler.page_count:
+            raise ValueError(f"Страница {params['page']} не найдена")
+        masks = handler.generate_masks(
+            page_num=params['page'],
+            overlap_percent=params['overlap'],
+            mask_format=params['format'],
+            mask_landscape=params['landscape']
+        )
+        return len(masks)
+    finally:
+        handler.close()
+
+
+class HTTPError(Exception):
+    """Ошибка обработки запроса с HTTP-кодом"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class SplitJob:
+    """Задание на разделение"""
+
+    def __init__(self, source_key, source_path, params, tiles):
+        self.id = uuid.uuid4().hex
+        self.source_key = source_key
+        self.source_path = source_path
+        self.params = params
+        self.tiles = tiles
+        self.status = 'queued'
+        self.result_path = None
+        self.error = None
+        self.done = asyncio.Event()
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'status': self.status,
+            'tiles': self.tiles,
+            'error': self.error,
+            'result': f"/jobs/{self.id}/result" if self.status == 'done' else None,
+        }
+
+
+class SplitService:
+    """
+    HTTP-сервис разделения PDF
+
+    Планирование: задания упорядочиваются по виртуальному сроку
+    (время поступления + оценка длительности по числу частей), поэтому
+    маленькие листы обгоняют большие, но большие не голодают бесконечно.
+    Тяжелые задания занимают не больше workers - 1 процессов, так что
+    один лист А0×3 не блокирует весь пул.
+    """
+
+    # Оценка длительности обработки одной части, сек
+    TILE_COST_S = 0.05
+    # Задание считается тяжелым начиная с этого количества частей
+    HEAVY_TILES = 40
+
+    def __init__(self, host='127.0.0.1', port=8765, workers=None, max_queue=64,
+                 max_upload_mb=1024, cache_dir=None, cache_entries=32):
+        self.host = host
+        self.port = port
+        self.workers = workers or max(1, (os.cpu_count() or 2) - 1)
+        self.max_queue = max_queue
+        self.max_upload = int(max_upload_mb * 1024 * 1024)
+        self.cache_dir = cache_dir or tempfile.mkdtemp(prefix='division_draw_')
+        self.cache_entries = cache_entries
+
+        self.executor = None
+        self.server = None
+        self.jobs = {}
+        self._dispatchers = []
+        self._seq = itertools.count()
+
+        # Ожидающие задания: (срок, порядковый номер, задание)
+        self.pending = []
+        self.job_ready = None
+        # Тяжелые задания занимают не больше heavy_limit процессов
+        self.heavy_limit = max(1, self.workers - 1)
+        self.running_heavy = 0
+        # Источники, для которых задание еще не поставлено в очередь
+        self._submitting = Counter()
+
+        # Кэш исходных документов: ключ -> путь к файлу
+        self.source_cache = OrderedDict()
+        # Кэш результатов: (ключ источника, параметры) -> задание
+        self.result_cache = OrderedDict()
+
+    # ------------------------------------------------------------------
+    # Запуск и остановка
+    # ------------------------------------------------------------------
+
+    async def start(self):
+        """Запуск сервера и диспетчеров пула"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        # Процессы пула запускаются до приема соединений: процесс, созданный
+        # во время запроса, унаследует сокет клиента и не даст его закрыть
+        await asyncio.get_running_loop().run_in_executor(self.executor, os.getpid)
+        self.job_ready = asyncio.Condition()
+        self._dispatchers = [
+            asyncio.create_task(self._dispatch())
+            for _ in range(self.workers)
+        ]
+        self.server = await asyncio.start_server(
+            self._handle_connection, self.host, self.port
+        )
+
+    async def stop(self):
+        """Остановка сервера"""
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+        for task in self._dispatchers:
+            task.cancel()
+        self._dispatchers = []
+        if self.executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    async def serve_forever(self):
+        await self.start()
+        try:
+            async with self.server:
+                await self.server.serve_forever()
+        finally:
+            await self.stop()
+
+    # ------------------------------------------------------------------
+    # Очередь заданий
+    # ------------------------------------------------------------------
+
+    def _is_heavy(self, job):
+        return job.tiles >= self.HEAVY_TILES
+
+    def _take_job(self):
+        """
+        Выбор задания с самым ранним сроком среди доступных
+
+        Тяжелое задание доступно, только если есть свободный слот для
+        тяжелых; иначе оно остается в очереди, а диспетчер берет легкое.
+        """
+        heavy_free = self.running_heavy < self.heavy_limit
+        available = [entry for entry in self.pending
+                     if heavy_free or not self._is_heavy(entry[2])]
+        if not available:
+            return None
+        entry = min(available, key=lambda entry: entry[:2])
+        self.pending.remove(entry)
+        job = entry[2]
+        if self._is_heavy(job):
+            self.running_heavy += 1
+        return job
+
+    async def _dispatch(self):
+        """Диспетчер: забирает задания из очереди и отправляет в пул"""
+        loop = asyncio.get_running_loop()
+        while True:
+            async with self.job_ready:
+                job = self._take_job()
+                while job is None:
+                    await self.job_ready.wait()
+                    job = self._take_job()
+
+            try:
+                job.status = 'running'
+                job_dir = os.path.join(self.cache_dir, 'jobs', job.id)
+                os.makedirs(job_dir, exist_ok=True)
+                job.result_path = await loop.run_in_executor(
+                    self.executor, _split_worker,
+                    job.source_path, job.params, job_dir
+                )
+                job.status = 'done'
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Задание с ошибкой остается в кэше результатов (для запроса
+                # статуса) и удаляется вместе с остальными при вытеснении
+                job.status = 'error'
+                job.error = str(e)
+                shutil.rmtree(os.path.join(self.cache_dir, 'jobs', job.id), ignore_errors=True)
+            finally:
+                job.done.set()
+                if self._is_heavy(job):
+                    self.running_heavy -= 1
+                    # Освободился слот: ожидающее тяжелое задание стало доступно
+                    async with self.job_ready:
+                        self.job_ready.notify_all()
+
+    async def submit(self, source_key, source_path, params):
+        """Постановка задания в очередь (с учетом кэша результатов)"""
+        result_key = (source_key, self._params_key(params))
+        cached = self.result_cache.get(result_key)
+        if cached and cached.status != 'error':
+            self.result_cache.move_to_end(result_key)
+            return cached
+        if cached:
+            # Повторная попытка после ошибки заменяет старое задание
+            self._drop_result(result_key)
+
+        if len(self.pending) >= self.max_queue:
+            raise HTTPError(503, "Очередь заданий заполнена")
+
+        loop = asyncio.get_running_loop()
+        try:
+            tiles = await loop.run_in_executor(None, _estimate_tiles, source_path, params)
+        except Exception as e:
+            raise HTTPError(400, f"Ошибка чтения PDF: {e}")
+
+        job = SplitJob(source_key, source_path, params, tiles)
+        deadline = loop.time() + tiles * self.TILE_COST_S
+        if len(self.pending) >= self.max_queue:
+            raise HTTPError(503, "Очередь заданий заполнена")
+        async with self.job_ready:
+            self.pending.append((deadline, next(self._seq), job))
+            self.job_ready.notify()
+
+        self.jobs[job.id] = job
+        self.result_cache[result_key] = job
+        self._evict_results()
+        return job
+
+    @staticmethod
+    def _params_key(params):
+        return (params['page'], params['format'], params['landscape'], params['overlap'])
+
+    def _drop_result(self, result_key):
+        old_job = self.result_cache.pop(result_key)
+        self.jobs.pop(old_job.id, None)
+        shutil.rmtree(os.path.join(self.cache_dir, 'jobs', old_job.id), ignore_errors=True)
+
+    def _evict_results(self):
+        """Удаление старых результатов (и заданий с ошибкой) сверх лимита кэша"""
+        while len(self.result_cache) > self.cache_entries:
+            old_key, old_job = next(iter(self.result_cache.items()))
+            if not old_job.done.is_set():
+                break
+            self._drop_result(old_key)
+
+    # ------------------------------------------------------------------
+    # Кэш исходных документов
+    # ------------------------------------------------------------------
+
+    def _cache_upload(self, data, file_name):
+        """Сохранение загруженного PDF в кэш (ключ - хэш содержимого)"""
+        key = hashlib.sha256(data).hexdigest()
+        cached = self.source_cache.get(key)
+        if cached and os.path.exists(cached):
+            self.source_cache.move_to_end(key)
+            return key, cached
+
+        source_dir = os.path.join(self.cache_dir, 'sources', key)
+        os.makedirs(source_dir, exist_ok=True)
+        # Имя файла сохраняется: от него зависят имена частей
+        path = os.path.join(source_dir, file_name)
+        with open(path, 'wb') as f:
+            f.write(data)
+
+        self.source_cache[key] = path
+        self._evict_sources()
+        return key, path
+
+    def _cache_path(self, path):
+        """Регистрация локального файла в кэше (без копирования)"""
+        if not os.path.isfile(path):
+            raise HTTPError(400, f"Файл не найден: {path}")
+        stat = os.stat(path)
+        key = hashlib.sha256(
+            f"{os.path.realpath(path)}|{stat.st_size}|{stat.st_mtime_ns}".encode()
+        ).hexdigest()
+        self.source_cache[key] = path
+        self.source_cache.move_to_end(key)
+        self._evict_sources()
+        return key, path
+
+    def _evict_sources(self):
+        """
+        Удаление старых источников сверх лимита кэша
+
+        Источник, на который ссылается невыполненное задание, не удаляется.
+        Последний добавленный источник тоже остается: задание для него
+        еще только ставится в очередь.
+        """
+        uploads_dir = os.path.join(self.cache_dir, 'sources')
+        in_use = {job.source_key for job in self.jobs.values() if not job.done.is_set()}
+        in_use.update(key for key, count in self._submitting.items() if count)
+        for old_key in list(self.source_cache)[:-1]:
+            if len(self.source_cache) <= self.cache_entries:
+                break
+            if old_key in in_use:
+                continue
+            old_path = self.source_cache.pop(old_key)
+            if os.path.dirname(os.path.dirname(old_path)) == uploads_dir:
+                shutil.rmtree(os.path.dirname(old_path), ignore_errors=True)
+
+    # ------------------------------------------------------------------
+    # HTTP
+    # ------------------------------------------------------------------
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            status, headers, body = await self._handle_request(reader)
+        except HTTPError as e:
+            status, headers, body = self._json(e.status, {'error': e.message})
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+            return
+        except Exception as e:
+            status, headers, body = self._json(500, {'error': str(e)})
+
+        try:
+            response = self._encode_response(status, headers, body)
+        except Exception as e:
+            response = self._encode_response(*self._json(500, {'error': str(e)}))
+
+        try:
+            writer.write(response)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _encode_response(status, headers, body):
+        head = [f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}"]
+        headers['Content-Length'] = str(len(body))
+        headers['Connection'] = 'close'
+        head.extend(f"{name}: {value}" for name, value in headers.items())
+        return ('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body
+
+    async def _handle_request(self, reader):
+        request_line = (await reader.readline()).decode('latin-1').strip()
+        if not request_line:
+            raise HTTPError(400, "Пустой запрос")
+        try:
+            method, target, _ = request_line.split(' ', 2)
+        except ValueError:
+            raise HTTPError(400, "Некорректная строка запроса")
+
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode('latin-1')
+            if line in ('\r\n', '\n', ''):
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        length = int(headers.get('content-length', 0) or 0)
+        if length > self.max_upload:
+            raise HTTPError(413, "Файл слишком большой")
+        body = await reader.readexactly(length) if length else b''
+
+        url = urlsplit(target)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        parts = [p for p in url.path.split('/') if p]
+
+        if parts == ['health']:
+            return self._json(200, {
+                'workers': self.workers,
+                'queued': len(self.pending),
+                'jobs': len(self.jobs),
+            })
+        if parts == ['split']:
+            if method != 'POST':
+                raise HTTPError(405, "Используйте POST")
+            return await self._handle_split(headers, body, query)
+        if len(parts) in (2, 3) and parts[0] == 'jobs':
+            if method != 'GET':
+                raise HTTPError(405, "Используйте GET")
+            job = self.jobs.get(parts[1])
+            if not job:
+                raise HTTPError(404, "Задание не найдено")
+            if len(parts) == 2:
+                return self._json(200, job.to_dict())
+            if parts[2] == 'result':
+                return self._result(job)
+        raise HTTPError(404, "Неизвестный адрес")
+
+    async def _handle_split(self, headers, body, query):
+        content_type = headers.get('content-type', '').split(';')[0].strip()
+        if content_type == 'application/json':
+            try:
+                payload = json.loads(body.decode('utf-8') or '{}')
+            except ValueError:
+                raise HTTPError(400, "Некорректный JSON")
+            query = {**{k: str(v) for k, v in payload.items() if k != 'path'}, **query}
+            if 'path' not in payload:
+                raise HTTPError(400, "Не указан путь к PDF (path)")
+            source_key, source_path = self._cache_path(payload['path'])
+        else:
+            if not body:
+                raise HTTPError(400, "Пустое тело запроса")
+            if not body.startswith(b'%PDF'):
+                raise HTTPError(400, "Тело запроса не является PDF")
+            file_name = os.path.basename(query.get('name', 'document.pdf'))
+            if not file_name.lower().endswith('.pdf'):
+                file_name += '.pdf'
+            source_key, source_path = self._cache_upload(body, file_name)
+
+        params = self._parse_params(query)
+        # Пока оценивается количество частей, источник нельзя удалять из кэша
+        self._submitting[source_key] += 1
+        try:
+            job = await self.submit(source_key, source_path, params)
+        finally:
+            self._submitting[source_key] -= 1
+            if not self._submitting[source_key]:
+                del self._submitting[source_key]
+
+        if query.get('wait', '0') in ('1', 'true', 'yes'):
+            await job.done.wait()
+            return self._result(job)
+        return self._json(202, job.to_dict())
+
+    @staticmethod
+    def _parse_params(query):
+        try:
+            params = {
+                'page': int(query.get('page', 0)),
+                'format': query.get('format', 'A4').upper(),
+                'landscape': query.get('landscape', '0').lower() in ('1', 'true', 'yes'),
+                'overlap': float(query.get('overlap', 15)),
+            }
+        except ValueError:
+            raise HTTPError(400, "Некорректные параметры разделения")
+        if params['format'] not in ('A4', 'A3'):
+            raise HTTPError(400, "Формат маски должен быть A4 или A3")
+        if not 0 <= params['overlap'] < 100:
+            raise HTTPError(400, "Перекрытие должно быть в диапазоне 0-100%")
+        if params['page'] < 0:
+            raise HTTPError(400, "Некорректный номер страницы")
+        return params
+
+    def _result(self, job):
+        if job.status == 'error':
+            raise HTTPError(500, job.error)
+        if job.status != 'done':
+            raise HTTPError(409, "Задание еще не выполнено")
+        with open(job.result_path, 'rb') as f:
+            data = f.read()
+        base_name = os.path.splitext(os.path.basename(job.source_path))[0]
+        return 200, {
+            'Content-Type': 'application/zip',
+            'Content-Disposition': self._content_disposition(f"{base_name}_parts.zip"),
+        }, data
+
+    @staticmethod
+    def _content_disposition(file_name):
+        """
+        Заголовок с именем файла: ASCII-замена для старых клиентов
+        и имя в UTF-8 по RFC 5987 (кириллические имена чертежей)
+        """
+        fallback = ''.join(
+            char if 32 <= ord(char) < 127 and char not in '"\\' else '_'
+            for char in file_name
+        )
+        return (f'attachment; filename="{fallback}"; '
+                f"filename*=UTF-8''{quote(file_name, safe='')}")
+
+    @staticmethod
+    def _json(status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        return status, {'Content-Type': 'application/json; charset=utf-8'}, body
+
+
+def run_service(host='127.0.0.1', port=8765, workers=None):
+    """Запуск сервиса (блокирующий)"""
+    service = SplitService(host=host, port=port, workers=workers)
+    print(f"Division Draw: сервис разделения на http://{host}:{port}")
+    try:
+        asyncio.run(service.serve_forever())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,374 @@
+"""
+Проверка результата разделения PDF
+
+Каждая часть и соответствующая ей область исходной страницы рендерятся
+с низким разрешением и сравниваются поплиточно (NumPy). Части скана,
+созданные вырезанием фрагмента, сравниваются с исходным изображением
+в его собственном разрешении. Дополнительно проверяется, что маски
+покрывают всю страницу.
+"""
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz  # PyMuPDF
+import numpy as np
+
+from core.image_split import find_scan_image
+
+
+def render_gray(page, matrix, clip=None):
+    """
+    Рендеринг в оттенках серого в массив NumPy
+
+    Args:
+        page: страница или DisplayList
+
+    Returns:
+        tuple: (массив h×w uint8, смещение x, смещение y)
+    """
+    pix = page.get_pixmap(matrix=matrix, clip=clip, colorspace=fitz.csGRAY, alpha=False)
+    if pix.width == 0 or pix.height == 0:
+        return np.full((0, 0), 255, dtype=np.uint8), pix.x, pix.y
+    data = np.frombuffer(pix.samples_mv, dtype=np.uint8)
+    image = data.reshape(pix.height, pix.stride)[:, :pix.width].copy()
+    return image, pix.x, pix.y
+
+
+def tile_means(diff, tile_px):
+    """Средняя разница по плиткам tile_px × tile_px"""
+    height, width = diff.shape
+    rows = -(-height // tile_px)
+    cols = -(-width // tile_px)
+    padded = np.zeros((rows * tile_px, cols * tile_px), dtype=np.float32)
+    padded[:height, :width] = diff
+    return padded.reshape(rows, tile_px, cols, tile_px).mean(axis=(1, 3))
+
+
+def _verify_parts(source_path, page_num, tasks, zoom, tile_px, threshold):
+    """
+    Сравнение частей с исходником (выполняется в дочернем процессе)
+
+    Args:
+        tasks: список (номер, маска, путь к части)
+    """
+    results = []
+    source = fitz.open(source_path)
+    try:
+        page = source[page_num]
+        # Содержимое страницы разбирается один раз на все части
+        display_list = page.get_displaylist()
+        scan = find_scan_image(page)
+        try:
+            for index, mask, part_path in tasks:
+                results.append(_verify_part(display_list, page.rect, index, mask,
+                                            part_path, zoom, tile_px, threshold,
+                                            scan))
+        finally:
+            if scan is not None:
+                scan.release()
+    finally:
+        source.close()
+    return results
+
+
+def _compare_scan_part(scan, mask, part_page, tile_px, threshold, result):
+    """
+    Сравнение фрагмента скана в части с исходным изображением
+
+    Рендеры части и исходника здесь не сравниваются: растеризатор
+    выравнивает изображение по сетке пикселей, и фрагмент, начинающийся
+    в другой точке, сглаживается иначе, чем тот же участок целого скана.
+
+    Returns:
+        bool: False - часть создана не вырезанием фрагмента
+              (нужна обычная проверка по рендеру)
+    """
+    clip = fitz.Rect(mask['x'], mask['y'],
+                     mask['x'] + mask['width'], mask['y'] + mask['height'])
+    box = scan.pixel_box(clip)
+    images = part_page.get_images(full=True)
+    if box is None:
+        # Маска вне скана - часть должна быть пустой
+        if images:
+            return False
+        result['max_diff'] = 0.0
+        result['ok'] = True
+        return True
+
+    if len(images) != 1:
+        return False
+    xref = images[0][0]
+    placements = part_page.get_image_rects(xref)
+    fragment_rect = scan.fragment_rect(box)
+    expected_rect = fragment_rect + (-clip.x0, -clip.y0, -clip.x0, -clip.y0)
+    if len(placements) != 1 or any(
+            abs(a - b) > 0.05 for a, b in zip(placements[0], expected_rect)):
+        return False
+
+    pix = fitz.Pixmap(part_page.parent, xref)
+    if (pix.width, pix.height) != (box[2] - box[0], box[3] - box[1]):
+        return False
+    if pix.n != 1:
+        pix = fitz.Pixmap(fitz.csGRAY, pix)
+    actual = np.frombuffer(pix.samples_mv, dtype=np.uint8)
+    actual = actual.reshape(pix.height, pix.stride)[:, :pix.width].astype(np.int16)
+    expected = np.asarray(scan.image.crop(box).convert('L'), dtype=np.int16)
+
+    means = tile_means(np.abs(actual - expected), tile_px)
+    result['max_diff'] = float(means.max()) if means.size else 0.0
+
+    scale_x, scale_y = scan.scale
+    for row, col in np.argwhere(means > threshold):
+        x0 = fragment_rect.x0 + col * tile_px / scale_x
+        y0 = fragment_rect.y0 + row * tile_px / scale_y
+        result['mismatched_tiles'].append((
+            float(x0), float(y0),
+            float(min(x0 + tile_px / scale_x, fragment_rect.x1)),
+            float(min(y0 + tile_px / scale_y, fragment_rect.y1))
+        ))
+
+    result['ok'] = not result['mismatched_tiles']
+    return True
+
+
+def _verify_part(display_list, page_rect, index, mask, part_path, zoom,
+                 tile_px, threshold, scan=None):
+    result = {
+        'index': index,
+        'file': part_path,
+        'ok': False,
+        'max_diff': None,
+        'mismatched_tiles': [],
+        'error': None,
+    }
+
+    if not os.path.exists(part_path):
+        result['error'] = "Файл части не найден"
+        return result
+
+    part_doc = fitz.open(part_path)
+    try:
+        if len(part_doc) == 0:
+            result['error'] = "Файл части пуст"
+            return result
+        part_page = part_doc[0]
+        # Размер части должен совпадать с размером маски
+        if (abs(part_page.rect.width - mask['width']) > 1 or
+                abs(part_page.rect.height - mask['height']) > 1):
+            result['error'] = (f"Размер части {part_page.rect.width:.0f} × "
+                               f"{part_page.rect.height:.0f} pt не совпадает с маской "
+                               f"{mask['width']:.0f} × {mask['height']:.0f} pt")
+            return result
+        if scan is not None and _compare_scan_part(scan, mask, part_page,
+                                                   tile_px, threshold, result):
+            return result
+        part_image, _, _ = render_gray(part_page, fitz.Matrix(zoom, zoom))
+    finally:
+        part_doc.close()
+
+    mask_rect = fitz.Rect(mask['x'], mask['y'],
+                          mask['x'] + mask['width'], mask['y'] + mask['height'])
+
+    # Исходник рендерится со сдвигом, совмещающим начало маски с (0, 0):
+    # сетка пикселей совпадает с сеткой рендера части
+    matrix = fitz.Matrix(1, 0, 0, 1, -mask_rect.x0, -mask_rect.y0) * fitz.Matrix(zoom, zoom)
+    expected = np.full(part_image.shape, 255, dtype=np.uint8)
+    visible = mask_rect & page_rect
+    if not visible.is_empty:
+        source_image, offset_x, offset_y = render_gray(display_list, matrix,
+                                                       clip=visible)
+        height = max(0, min(source_image.shape[0], expected.shape[0] - offset_y))
+        width = max(0, min(source_image.shape[1], expected.shape[1] - offset_x))
+        if height and width and offset_x >= 0 and offset_y >= 0:
+            expected[offset_y:offset_y + height, offset_x:offset_x + width] = \
+                source_image[:height, :width]
+
+    diff = np.abs(part_image.astype(np.int16) - expected.astype(np.int16))
+    means = tile_means(diff, tile_px)
+    result['max_diff'] = float(means.max()) if means.size else 0.0
+
+    tile_size = tile_px / zoom
+    for row, col in np.argwhere(means > threshold):
+        x0 = mask_rect.x0 + col * tile_size
+        y0 = mask_rect.y0 + row * tile_size
+        result['mismatched_tiles'].append((
+            float(x0), float(y0),
+            float(min(x0 + tile_size, mask_rect.x1)),
+            float(min(y0 + tile_size, mask_rect.y1))
+        ))
+
+    result['ok'] = not result['mismatched_tiles']
+    return result
+
+
+def find_uncovered_regions(page_width, page_height, masks, zoom, cell_px=4):
+    """
+    Поиск областей страницы, не покрытых ни одной маской
+
+    Returns:
+        tuple: (список прямоугольников в points, доля непокрытой площади)
+    """
+    height = int(page_height * zoom)
+    width = int(page_width * zoom)
+    if height <= 0 or width <= 0:
+        return [], 0.0
+
+    covered = np.zeros((height, width), dtype=bool)
+    for mask in masks:
+        # Пиксель покрыт, если целиком лежит внутри маски
+        x0 = max(0, int(np.ceil(mask['x'] * zoom - 1e-6)))
+        y0 = max(0, int(np.ceil(mask['y'] * zoom - 1e-6)))
+        x1 = min(width, int(np.floor((mask['x'] + mask['width']) * zoom + 1e-6)))
+        y1 = min(height, int(np.floor((mask['y'] + mask['height']) * zoom + 1e-6)))
+        if x1 > x0 and y1 > y0:
+            covered[y0:y1, x0:x1] = True
+
+    uncovered = ~covered
+    uncovered_fraction = float(uncovered.mean())
+    if not uncovered_fraction:
+        return [], 0.0
+
+    # Объединяем непокрытые пиксели в ячейки, ячейки - в прямоугольники
+    rows = -(-height // cell_px)
+    cols = -(-width // cell_px)
+    padded = np.zeros((rows * cell_px, cols * cell_px), dtype=bool)
+    padded[:height, :width] = uncovered
+    cells = padded.reshape(rows, cell_px, cols, cell_px).any(axis=(1, 3))
+
+    regions = cells_to_regions(cells, cell_px / zoom, page_width, page_height)
+    return regions, uncovered_fraction
+
+
+def cells_to_regions(cells, cell_size, page_width, page_height):
+    """
+    Объединение отмеченных ячеек сетки в прямоугольники
+
+    Соседние ячейки строки объединяются в серии, одинаковые серии
+    соседних строк - в один прямоугольник.
+
+    Returns:
+        list: прямоугольники (x0, y0, x1, y1) в points
+    """
+    rows = cells.shape[0]
+    regions = []
+    open_runs = {}
+    for row in range(rows + 1):
+        runs = set()
+        if row < rows:
+            line = np.concatenate(([False], cells[row], [False]))
+            edges = np.flatnonzero(line[1:] != line[:-1])
+            runs = set(zip(edges[0::2], edges[1::2]))
+        # Закрываем серии, которые не продолжаются в текущей строке
+        for run in list(open_runs):
+            if run not in runs:
+                start_row = open_runs.pop(run)
+                regions.append((
+                    float(run[0] * cell_size),
+                    float(start_row * cell_size),
+                    float(min(run[1] * cell_size, page_width)),
+                    float(min(row * cell_size, page_height))
+                ))
+        for run in runs:
+            open_runs.setdefault(run, row)
+
+    return regions
+
+
+def verify_split(source_path, masks, output_files, page_num=0, dpi=36,
+                 tile_px=8, threshold=12.0, workers=None, executor=None):
+    """
+    Проверка, что части точно воспроизводят исходную страницу
+
+    Args:
+        source_path: путь к исходному PDF
+        masks: маски (в координатах PDF), по которым выполнено разделение
+        output_files: пути к частям в том же порядке
+        page_num: номер страницы
+        dpi: разрешение сравнения
+        tile_px: размер плитки сравнения в пикселях
+        threshold: допустимая средняя разница яркости в плитке (0-255)
+        workers: количество процессов
+        executor: внешний пул процессов (если не задан - создается свой)
+
+    Returns:
+        dict: отчет о проверке
+    """
+    started = time.perf_counter()
+    zoom = dpi / 72.0
+
+    source = fitz.open(source_path)
+    try:
+        page_rect = source[page_num].rect
+    finally:
+        source.close()
+
+    tasks = list(zip(range(1, len(masks) + 1), masks, output_files))
+    workers = workers or min(len(tasks), os.cpu_count() or 1) or 1
+    # Части группируются, чтобы каждый процесс открывал исходник один раз
+    chunks = [tasks[i::workers] for i in range(workers) if tasks[i::workers]]
+
+    parts = []
+    if chunks:
+        own_executor = executor is None
+        if own_executor:
+            executor = ProcessPoolExecutor(max_workers=len(chunks))
+        try:
+            futures = [
+                executor.submit(_verify_parts, source_path, page_num, chunk,
+                                zoom, tile_px, threshold)
+                for chunk in chunks
+            ]
+            for future in futures:
+                parts.extend(future.result())
+        finally:
+            if own_executor:
+                executor.shutdown()
+    parts.sort(key=lambda part: part['index'])
+
+    uncovered, uncovered_fraction = find_uncovered_regions(
+        page_rect.width, page_rect.height, masks, zoom
+    )
+
+    count_ok = len(masks) == len(output_files)
+    return {
+        'ok': count_ok and not uncovered and all(part['ok'] for part in parts),
+        'parts': parts,
+        'parts_expected': len(masks),
+        'parts_found': len(output_files),
+        'uncovered': uncovered,
+        'uncovered_percent': uncovered_fraction * 100,
+        'elapsed': time.perf_counter() - started,
+    }
+
+
+def format_report(report, max_items=10):
+    """Краткое текстовое описание отчета о проверке"""
+    lines = []
+    if report['ok']:
+        lines.append("Проверка пройдена: части совпадают с исходником, "
+                     "страница покрыта полностью")
+    else:
+        if report['parts_expected'] != report['parts_found']:
+            lines.append(f"Количество частей: {report['parts_found']} "
+                         f"(ожидалось {report['parts_expected']})")
+
+        bad_parts = [part for part in report['parts'] if not part['ok']]
+        if bad_parts:
+            lines.append(f"Части с расхождениями: {len(bad_parts)}")
+            for part in bad_parts[:max_items]:
+                name = os.path.basename(part['file'])
+                if part['error']:
+                    lines.append(f"  {name}: {part['error']}")
+                else:
+                    lines.append(f"  {name}: плиток с расхождением "
+                                 f"{len(part['mismatched_tiles'])}")
+
+        if report['uncovered']:
+            lines.append(f"Непокрытые области: {len(report['uncovered'])} "
+                         f"({report['uncovered_percent']:.2f}% площади)")
+            for x0, y0, x1, y1 in report['uncovered'][:max_items]:
+                lines.append(f"  ({x0:.0f}, {y0:.0f}) - ({x1:.0f}, {y1:.0f}) pt")
+
+    lines.append(f"Время проверки: {report['elapsed']:.1f} с")
+    return "\n".join(lines)
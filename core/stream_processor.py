@@ -0,0 +1,193 @@
+"""
+Потоковая обработка больших PDF документов с ограничением памяти
+"""
+import gc
+import mmap
+import os
+
+import fitz  # PyMuPDF
+
+from core.pdf_handler import PDFHandler
+from core.text_index import TextIndex
+
+
+def current_rss_bytes():
+    """Текущий размер резидентной памяти процесса (RSS) в байтах"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        return None
+
+
+class StreamingPDFHandler(PDFHandler):
+    """
+    Обработчик PDF для очень больших документов
+
+    Документ открывается из отображенного в память файла (mmap), страницы
+    обрабатываются по одной, между страницами освобождаются объекты страниц
+    и кэши MuPDF. Потребление памяти контролируется лимитом RSS.
+    """
+
+    def __init__(self, rss_limit_mb=2048):
+        super().__init__()
+        self.rss_limit_mb = rss_limit_mb
+        self._file = None
+        self._mmap = None
+
+    def load_pdf(self, file_path):
+        """Загрузка PDF файла через mmap (без чтения в память целиком)"""
+        try:
+            self._open_mapped(file_path)
+            self.file_path = file_path
+            self.page_count = len(self.document)
+            # Страница не удерживается на время сессии
+            self.current_page = None
+            return True
+        except Exception as e:
+            self._release_mapping()
+            raise Exception(f"Ошибка загрузки PDF: {str(e)}")
+
+    def _open_mapped(self, file_path):
+        self._file = open(file_path, 'rb')
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.document = fitz.open(stream=memoryview(self._mmap), filetype='pdf')
+        except (TypeError, ValueError):
+            # Старые версии PyMuPDF не принимают memoryview:
+            # MuPDF и так читает файл с диска по мере необходимости
+            self._release_mapping()
+            self.document = fitz.open(file_path)
+
+    def _release_mapping(self):
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # Буфер еще используется документом - закроется вместе с ним
+                pass
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def release_caches(self):
+        """Освобождение кэшей MuPDF и неиспользуемых объектов Python"""
+        gc.collect()
+        fitz.TOOLS.store_shrink(100)
+        if self._mmap is not None and hasattr(mmap, 'MADV_DONTNEED'):
+            # Прочитанные страницы отображенного файла тоже входят в RSS;
+            # при следующем обращении они читаются с диска заново
+            self._mmap.madvise(mmap.MADV_DONTNEED)
+
+    def enforce_memory_limit(self):
+        """
+        Проверка лимита RSS
+
+        При превышении лимита сбрасываются кэши, затем документ
+        переоткрывается (освобождаются все разобранные объекты PDF).
+        Если и после этого лимит превышен - выбрасывается MemoryError.
+        """
+        if not self.rss_limit_mb:
+            return
+
+        limit = self.rss_limit_mb * 1024 * 1024
+        rss = current_rss_bytes()
+        if rss is None or rss <= limit:
+            return
+
+        self.release_caches()
+        rss = current_rss_bytes()
+        if rss <= limit:
+            return
+
+        self.reopen()
+        rss = current_rss_bytes()
+        if rss > limit:
+            raise MemoryError(
+                f"Превышен лимит памяти: {rss / 1024 / 1024:.0f} МБ "
+                f"(лимит {self.rss_limit_mb} МБ)"
+            )
+
+    def reopen(self):
+        """Переоткрытие документа для сброса накопленных объектов"""
+        file_path = self.file_path
+        self.close()
+        self.load_pdf(file_path)
+
+    def iter_pages(self, pages=None):
+        """
+        Последовательный обход страниц
+
+        Страница выдается по одной; после обработки ссылка на нее
+        освобождается, кэши очищаются и проверяется лимит памяти.
+
+        Args:
+            pages: номера страниц (по умолчанию все)
+
+        Yields:
+            int: номер страницы
+        """
+        if not self.is_loaded():
+            raise Exception("PDF не загружен")
+
+        if pages is None:
+            pages = range(self.page_count)
+
+        for page_num in pages:
+            yield page_num
+            self.release_caches()
+            self.enforce_memory_limit()
+
+    def divide_document(self, output_dir, overlap_percent=15, mask_format='A4',
+                        mask_landscape=False, pages=None, progress_callback=None,
+                        build_index=False):
+        """
+        Разделение всех страниц документа с постоянным потреблением памяти
+
+        Части каждой страницы сохраняются в подпапку page_NNN.
+        Раскладка масок берется из шаблонов (одно вычисление на размер листа).
+        Текстовый индекс (build_index) - один на весь документ в output_dir.
+
+        Returns:
+            dict: номер страницы -> список путей к созданным файлам
+        """
+        results = {}
+        text_index = None
+        if build_index:
+            os.makedirs(output_dir, exist_ok=True)
+            text_index = TextIndex.for_directory(output_dir)
+        try:
+            for page_num in self.iter_pages(pages):
+                masks = self.plan_masks(
+                    page_num=page_num,
+                    overlap_percent=overlap_percent,
+                    mask_format=mask_format,
+                    mask_landscape=mask_landscape
+                )
+                page_dir = os.path.join(output_dir, f"page_{page_num + 1:03d}")
+                os.makedirs(page_dir, exist_ok=True)
+                results[page_num] = self.divide_pdf(masks, page_dir, page_num)
+                if text_index is not None:
+                    text_index.add_page(self.document[page_num], masks,
+                                        results[page_num], self.file_path, page_num)
+
+                if progress_callback:
+                    progress_callback(page_num, self.page_count)
+        finally:
+            if text_index is not None:
+                text_index.close()
+
+        return results
+
+    def close(self):
+        """Закрытие документа и освобождение отображения файла"""
+        super().close()
+        self.release_caches()
+        self._release_mapping()
@@ -0,0 +1,198 @@
+"""
+Текстовый индекс частей разделенного чертежа
+
+При разделении текстовые фрагменты исходной страницы сопоставляются
+с масками, в которые они попадают, и сохраняются в SQLite (FTS5) рядом
+с частями. Один индекс обслуживает все части в папке.
+"""
+import os
+import sqlite3
+
+import numpy as np
+
+from core.page_analysis import collect_text_spans
+
+
+INDEX_FILE_NAME = 'parts_index.sqlite'
+
+
+def _fts5_available(connection):
+    try:
+        connection.execute("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(text)")
+        connection.execute("DROP TABLE temp.fts5_probe")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+def spans_to_masks(span_boxes, masks):
+    """
+    Сопоставление текстовых фрагментов маскам
+
+    Фрагмент относится ко всем маскам, которые содержат его целиком.
+    Фрагмент, разрезанный швом, относится к маскам, содержащим его центр.
+
+    Returns:
+        list: пары (номер фрагмента, номер маски с 0)
+    """
+    if not len(span_boxes) or not masks:
+        return []
+
+    boxes = np.array([
+        (m['x'], m['y'], m['x'] + m['width'], m['y'] + m['height'])
+        for m in masks
+    ], dtype=np.float64)
+    spans = np.asarray(span_boxes, dtype=np.float64)
+    eps = 0.5
+
+    contains = (
+        (boxes[None, :, 0] <= spans[:, None, 0] + eps) &
+        (boxes[None, :, 1] <= spans[:, None, 1] + eps) &
+        (boxes[None, :, 2] >= spans[:, None, 2] - eps) &
+        (boxes[None, :, 3] >= spans[:, None, 3] - eps)
+    )
+
+    centers_x = (spans[:, 0] + spans[:, 2]) / 2
+    centers_y = (spans[:, 1] + spans[:, 3]) / 2
+    contains_center = (
+        (boxes[None, :, 0] <= centers_x[:, None]) &
+        (boxes[None, :, 2] >= centers_x[:, None]) &
+        (boxes[None, :, 1] <= centers_y[:, None]) &
+        (boxes[None, :, 3] >= centers_y[:, None])
+    )
+
+    unassigned = ~contains.any(axis=1)
+    contains[unassigned] = contains_center[unassigned]
+    span_ids, mask_ids = np.nonzero(contains)
+    return list(zip(span_ids.tolist(), mask_ids.tolist()))
+
+
+class TextIndex:
+    """Индекс текста частей в папке разделения"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.connection = sqlite3.connect(db_path)
+        self.use_fts = _fts5_available(self.connection)
+        self._create_schema()
+
+    @classmethod
+    def for_directory(cls, output_dir):
+        return cls(os.path.join(output_dir, INDEX_FILE_NAME))
+
+    def _create_schema(self):
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS parts (
+                file TEXT PRIMARY KEY,
+                source TEXT,
+                page INTEGER,
+                part_no INTEGER,
+                x REAL, y REAL, width REAL, height REAL
+            )
+        """)
+        if self.use_fts:
+            self.connection.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS spans USING fts5("
+                "text, file UNINDEXED, x0 UNINDEXED, y0 UNINDEXED, "
+                "x1 UNINDEXED, y1 UNINDEXED, "
+                "tokenize=\"unicode61 remove_diacritics 0\")"
+            )
+        else:
+            self.connection.executescript("""
+                CREATE TABLE IF NOT EXISTS spans (
+                    text TEXT, file TEXT,
+                    x0 REAL, y0 REAL, x1 REAL, y1 REAL
+                );
+                CREATE INDEX IF NOT EXISTS spans_file ON spans(file);
+            """)
+        self.connection.commit()
+
+    def add_page(self, page, masks, output_files, source_path, page_num=0):
+        """
+        Индексация страницы: текст каждой маски привязывается к ее части
+
+        Записи о перезаписываемых частях удаляются.
+        """
+        span_boxes, span_texts = collect_text_spans(page)
+        rows = []
+        for span_id, mask_id in spans_to_masks(span_boxes, masks):
+            x0, y0, x1, y1 = span_boxes[span_id]
+            rows.append((span_texts[span_id], output_files[mask_id],
+                         float(x0), float(y0), float(x1), float(y1)))
+
+        with self.connection:
+            self._remove_files(output_files)
+            self.connection.executemany(
+                "INSERT INTO parts VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (path, os.path.abspath(source_path), page_num,
+                     self._part_number(path, i + 1),
+                     m['x'], m['y'], m['width'], m['height'])
+                    for i, (m, path) in enumerate(zip(masks, output_files))
+                ]
+            )
+            self.connection.executemany(
+                "INSERT INTO spans (text, file, x0, y0, x1, y1) VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+
+    @staticmethod
+    def _part_number(path, default):
+        """Номер части из имени файла *_part_NNN.pdf"""
+        stem = os.path.splitext(os.path.basename(path))[0]
+        _, _, number = stem.rpartition('_part_')
+        return int(number) if number.isdigit() else default
+
+    def _remove_files(self, files):
+        files = list(files)
+        if not files:
+            return
+        placeholders = ', '.join('?' * len(files))
+        self.connection.execute(f"DELETE FROM parts WHERE file IN ({placeholders})", files)
+        self.connection.execute(f"DELETE FROM spans WHERE file IN ({placeholders})", files)
+
+    def search(self, query, limit=100):
+        """
+        Поиск частей по тексту
+
+        Returns:
+            list: словари с текстом, файлом части, номером части и положением
+        """
+        query = query.strip()
+        if not query:
+            return []
+
+        columns = ("SELECT s.text, s.file, p.part_no, p.source, p.page, "
+                   "s.x0, s.y0, s.x1, s.y1 ")
+        if self.use_fts:
+            # Фраза целиком; звездочка в конце - поиск по префиксу
+            prefix = query.endswith('*')
+            phrase = '"' + query.rstrip('*').replace('"', '""') + '"'
+            cursor = self.connection.execute(
+                columns +
+                "FROM spans s JOIN parts p ON p.file = s.file "
+                "WHERE spans MATCH ? ORDER BY p.part_no LIMIT ?",
+                (phrase + ('*' if prefix else ''), limit)
+            )
+        else:
+            cursor = self.connection.execute(
+                columns +
+                "FROM spans s JOIN parts p ON p.file = s.file "
+                "WHERE s.text LIKE ? ORDER BY p.part_no LIMIT ?",
+                (f"%{query.rstrip('*')}%", limit)
+            )
+
+        return [
+            {
+                'text': text,
+                'file': file,
+                'part_no': part_no,
+                'source': source,
+                'page': page,
+                'bbox': (x0, y0, x1, y1),
+            }
+            for text, file, part_no, source, page, x0, y0, x1, y1 in cursor
+        ]
+
+    def close(self):
+        self.connection.close()
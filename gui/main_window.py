@@ -3,18 +3,68 @@
 """
 from PySide6.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
                                QPushButton, QFileDialog, QMessageBox, QToolBar,
-                               QLabel, QComboBox, QSpinBox, QDoubleSpinBox, QGroupBox)
+                               QLabel, QComboBox, QSpinBox, QDoubleSpinBox, QGroupBox,
+                               QCheckBox, QLineEdit, QListWidget, QListWidgetItem,
+                               QDockWidget, QTabWidget)
 from PySide6.QtCore import Qt
 from PySide6.QtGui import QAction, QIcon
 from gui.pdf_viewer import PDFViewer
+from gui.minimap import MinimapWidget
+from gui.split_preview import SplitPreviewWidget
 from core.pdf_handler import PDFHandler
+from core.mask_templates import MaskTemplateStore
+from core.page_fingerprint import FingerprintCache
+from core.resource_manager import ResourceManager
+from core.split_scheduler import SplitScheduler, CostModel, format_schedule_report
+from core.split_verifier import verify_split, format_report
+from core.revision_compare import resplit_changed
+from core.text_index import TextIndex, INDEX_FILE_NAME
+
+
+class DocumentTab:
+    """Открытый документ: обработчик PDF, вид и ключ шаблона масок"""
+    
+    def __init__(self, pdf_handler, pdf_viewer):
+        self.pdf_handler = pdf_handler
+        self.pdf_viewer = pdf_viewer
+        # Ключ шаблона раскладки для текущих масок
+        self.template_key = None
 
 
 class MainWindow(QMainWindow):
-    def __init__(self):
+    def __init__(self, memory_limit_mb=2048, workers=None):
         super().__init__()
-        self.pdf_handler = PDFHandler()
+        # Пул процессов и бюджет памяти растров общие для всех вкладок
+        self.resources = ResourceManager(memory_limit_mb, workers)
+        # Шаблоны раскладки и кэш повторяющихся листов общие для всех документов
+        self.mask_templates = MaskTemplateStore()
+        self.fingerprints = FingerprintCache()
+        # Модель стоимости уточняется по замерам предыдущих разделений
+        self.cost_model = CostModel()
+        self.documents = {}
+        # Папка последнего разделения (для поиска по текстовому индексу)
+        self.index_dir = None
         self.init_ui()
+    
+    @property
+    def current_document(self):
+        return self.documents.get(self.tabs.currentWidget())
+    
+    @property
+    def pdf_handler(self):
+        return self.current_document.pdf_handler
+    
+    @property
+    def pdf_viewer(self):
+        return self.current_document.pdf_viewer
+    
+    @property
+    def template_key(self):
+        return self.current_document.template_key
+    
+    @template_key.setter
+    def template_key(self, value):
+        self.current_document.template_key = value
         
     def init_ui(self):
         self.setWindowTitle("Division Draw - Разделение PDF чертежей")
@@ -34,15 +84,122 @@ class MainWindow(QMainWindow):
         left_panel = self.create_control_panel()
         main_layout.addWidget(left_panel)
         
-        # Viewer для PDF
-        self.pdf_viewer = PDFViewer()
-        self.pdf_viewer.pdf_handler = self.pdf_handler
-        main_layout.addWidget(self.pdf_viewer, stretch=1)
+        # Вкладки открытых документов
+        self.tabs = QTabWidget()
+        self.tabs.setTabsClosable(True)
+        self.tabs.setMovable(True)
+        self.tabs.setDocumentMode(True)
+        self.tabs.tabCloseRequested.connect(self.close_document)
+        main_layout.addWidget(self.tabs, stretch=1)
         
         # Правая панель с настройками масок
         right_panel = self.create_mask_panel()
         main_layout.addWidget(right_panel)
         
+        # Навигатор (миникарта)
+        self.minimap = MinimapWidget()
+        minimap_dock = QDockWidget("Навигатор", self)
+        minimap_dock.setObjectName("minimap_dock")
+        minimap_dock.setWidget(self.minimap)
+        self.addDockWidget(Qt.RightDockWidgetArea, minimap_dock)
+        
+        # Предпросмотр частей
+        self.split_preview = SplitPreviewWidget()
+        preview_dock = QDockWidget("Предпросмотр частей", self)
+        preview_dock.setObjectName("preview_dock")
+        preview_dock.setWidget(self.split_preview)
+        self.addDockWidget(Qt.BottomDockWidgetArea, preview_dock)
+        
+        self.tabs.currentChanged.connect(self.activate_document)
+        self.add_document_tab()
+    
+    def add_document_tab(self):
+        """Новая пустая вкладка документа"""
+        pdf_handler = PDFHandler()
+        pdf_handler.mask_templates = self.mask_templates
+        pdf_handler.fingerprints = self.fingerprints
+        pdf_handler.memory_budget = self.resources.memory_budget
+        
+        pdf_viewer = PDFViewer()
+        pdf_viewer.pdf_handler = pdf_handler
+        pdf_viewer.memory_budget = self.resources.memory_budget
+        pdf_viewer.snap_to_seams = self.snap_check.isChecked()
+        
+        document = DocumentTab(pdf_handler, pdf_viewer)
+        self.documents[pdf_viewer] = document
+        index = self.tabs.addTab(pdf_viewer, "Новый документ")
+        self.tabs.setCurrentIndex(index)
+        return document
+    
+    def activate_document(self, index):
+        """Переключение вкладки: растры неактивных вкладок освобождаются первыми"""
+        document = self.current_document
+        if document is None:
+            return
+        self.resources.memory_budget.set_active(document.pdf_viewer, document.pdf_handler)
+        document.pdf_viewer.restore_rasters()
+        document.pdf_viewer.snap_to_seams = self.snap_check.isChecked()
+        self.minimap.set_viewer(document.pdf_viewer)
+        self.split_preview.set_viewer(document.pdf_viewer)
+        self.update_document_controls()
+    
+    def close_document(self, index):
+        """Закрытие вкладки документа"""
+        pdf_viewer = self.tabs.widget(index)
+        document = self.documents.get(pdf_viewer)
+        if document is None:
+            return
+        
+        if self.minimap.viewer is pdf_viewer:
+            self.minimap.set_viewer(None)
+        if self.split_preview.viewer is pdf_viewer:
+            self.split_preview.set_viewer(None)
+        budget = self.resources.memory_budget
+        budget.unregister_owner(pdf_viewer)
+        budget.unregister_owner(document.pdf_handler)
+        
+        self.tabs.removeTab(index)
+        del self.documents[pdf_viewer]
+        document.pdf_handler.close()
+        pdf_viewer.deleteLater()
+        
+        # Всегда остается хотя бы одна вкладка
+        if not self.documents:
+            self.add_document_tab()
+    
+    def find_document(self, file_path):
+        """Вкладка с уже открытым файлом"""
+        import os
+        for document in self.documents.values():
+            handler = document.pdf_handler
+            if handler.is_loaded() and os.path.abspath(handler.file_path) == os.path.abspath(file_path):
+                return document
+        return None
+    
+    def update_document_controls(self):
+        """Обновление панелей под документ текущей вкладки"""
+        import os
+        loaded = self.pdf_handler.is_loaded()
+        masks = self.pdf_viewer.get_masks()
+        
+        if loaded:
+            self.file_label.setText(f"Файл: {os.path.basename(self.pdf_handler.file_path)}")
+            self.page_label.setText(f"Страниц: {self.pdf_handler.page_count}")
+        else:
+            self.file_label.setText("Файл не загружен")
+            self.page_label.setText("Страница: -")
+        
+        self.generate_btn.setEnabled(loaded)
+        self.divide_all_btn.setEnabled(loaded)
+        self.add_a4_portrait_btn.setEnabled(loaded)
+        self.add_a4_landscape_btn.setEnabled(loaded)
+        self.add_a3_portrait_btn.setEnabled(loaded)
+        self.add_a3_landscape_btn.setEnabled(loaded)
+        self.masks_label.setText(f"Масок: {len(masks)}")
+        self.divide_btn.setEnabled(len(masks) > 0)
+        self.clear_masks_btn.setEnabled(len(masks) > 0)
+        self.update_mask_info(None)
+        
     def create_menu(self):
         menubar = self.menuBar()
         
@@ -54,6 +211,19 @@ class MainWindow(QMainWindow):
         open_action.triggered.connect(self.open_pdf)
         file_menu.addAction(open_action)
         
+        close_action = QAction("&Закрыть документ", self)
+        close_action.setShortcut("Ctrl+W")
+        close_action.triggered.connect(lambda: self.close_document(self.tabs.currentIndex()))
+        file_menu.addAction(close_action)
+        
+        divide_all_action = QAction("Разделить &все открытые документы...", self)
+        divide_all_action.triggered.connect(self.divide_all_documents)
+        file_menu.addAction(divide_all_action)
+        
+        compare_action = QAction("&Сравнить с предыдущей редакцией...", self)
+        compare_action.triggered.connect(self.compare_revision)
+        file_menu.addAction(compare_action)
+        
         file_menu.addSeparator()
         
         exit_action = QAction("&Выход", self)
@@ -142,6 +312,12 @@ class MainWindow(QMainWindow):
         overlap_layout.addWidget(self.overlap_spin)
         split_layout.addLayout(overlap_layout)
         
+        self.snap_check = QCheckBox("Швы по свободным зонам")
+        self.snap_check.setToolTip("Сдвигать маски так, чтобы границы не разрезали текст "
+                                   "и плотную графику")
+        self.snap_check.toggled.connect(self.toggle_seam_snapping)
+        split_layout.addWidget(self.snap_check)
+        
         self.generate_btn = QPushButton("Сгенерировать маски")
         self.generate_btn.clicked.connect(self.generate_masks)
         self.generate_btn.setEnabled(False)
@@ -167,6 +343,21 @@ class MainWindow(QMainWindow):
         self.divide_btn.setEnabled(False)
         divide_layout.addWidget(self.divide_btn)
         
+        self.divide_all_btn = QPushButton("Разделить все документы")
+        self.divide_all_btn.setToolTip("Все страницы открытых документов, маски по шаблонам "
+                                       "раскладки; тяжелые листы обрабатываются первыми")
+        self.divide_all_btn.clicked.connect(self.divide_all_documents)
+        self.divide_all_btn.setEnabled(False)
+        divide_layout.addWidget(self.divide_all_btn)
+        
+        self.verify_check = QCheckBox("Проверять результат")
+        self.verify_check.setChecked(True)
+        divide_layout.addWidget(self.verify_check)
+        
+        self.index_check = QCheckBox("Индекс текста частей")
+        self.index_check.setChecked(True)
+        divide_layout.addWidget(self.index_check)
+        
         divide_group.setLayout(divide_layout)
         layout.addWidget(divide_group)
         
@@ -227,6 +418,27 @@ class MainWindow(QMainWindow):
         add_group.setLayout(add_layout)
         layout.addWidget(add_group)
         
+        # Группа: Поиск по частям
+        search_group = QGroupBox("Поиск по частям")
+        search_layout = QVBoxLayout()
+        
+        self.search_edit = QLineEdit()
+        self.search_edit.setPlaceholderText("Номер помещения, марка узла...")
+        self.search_edit.returnPressed.connect(self.search_parts)
+        search_layout.addWidget(self.search_edit)
+        
+        self.index_dir_btn = QPushButton("Папка с частями...")
+        self.index_dir_btn.clicked.connect(self.choose_index_dir)
+        search_layout.addWidget(self.index_dir_btn)
+        
+        self.search_results = QListWidget()
+        self.search_results.itemActivated.connect(self.show_search_result)
+        self.search_results.itemClicked.connect(self.show_search_result)
+        search_layout.addWidget(self.search_results)
+        
+        search_group.setLayout(search_layout)
+        layout.addWidget(search_group)
+        
         layout.addStretch()
         
         return panel
@@ -237,23 +449,35 @@ class MainWindow(QMainWindow):
         )
         
         if file_path:
+            # Файл уже открыт - переходим на его вкладку
+            document = self.find_document(file_path)
+            if document is not None:
+                self.tabs.setCurrentWidget(document.pdf_viewer)
+                return
+            
+            # Правки масок переносятся на следующие листы того же формата
+            self.store_mask_overrides()
+            new_tab = self.pdf_handler.is_loaded()
+            if new_tab:
+                self.add_document_tab()
+            
             try:
+                self.template_key = None
                 self.pdf_handler.load_pdf(file_path)
                 self.pdf_viewer.load_pdf()
                 
                 # Обновляем UI
                 import os
-                self.file_label.setText(f"Файл: {os.path.basename(file_path)}")
-                self.page_label.setText(f"Страниц: {self.pdf_handler.page_count}")
-                self.generate_btn.setEnabled(True)
-                self.add_a4_portrait_btn.setEnabled(True)
-                self.add_a4_landscape_btn.setEnabled(True)
-                self.add_a3_portrait_btn.setEnabled(True)
-                self.add_a3_landscape_btn.setEnabled(True)
+                index = self.tabs.currentIndex()
+                self.tabs.setTabText(index, os.path.basename(file_path))
+                self.tabs.setTabToolTip(index, file_path)
+                self.update_document_controls()
                 
                 QMessageBox.information(self, "Успех", 
                     f"PDF загружен успешно!\nСтраниц: {self.pdf_handler.page_count}")
             except Exception as e:
+                if new_tab:
+                    self.close_document(self.tabs.currentIndex())
                 QMessageBox.critical(self, "Ошибка", f"Не удалось загрузить PDF:\n{str(e)}")
     
     def generate_masks(self):
@@ -263,18 +487,29 @@ class MainWindow(QMainWindow):
         
         try:
             overlap_percent = self.overlap_spin.value()
-            format_text = self.format_combo.currentText()
             mask_format = self.mask_format_combo.currentText()
             is_landscape = self.orientation_combo.currentText() == "Альбомная"
             
-            # Генерируем маски
-            masks = self.pdf_handler.generate_masks(
+            # Сохраняем правки текущей раскладки перед заменой
+            self.store_mask_overrides()
+            
+            # Маски берутся из шаблона для листов этого размера
+            masks = self.pdf_handler.plan_masks(
+                overlap_percent=overlap_percent,
+                mask_format=mask_format,
+                mask_landscape=is_landscape
+            )
+            self.template_key = self.pdf_handler.get_template_key(
                 overlap_percent=overlap_percent,
-                format_hint=format_text,
                 mask_format=mask_format,
                 mask_landscape=is_landscape
             )
             
+            if self.snap_check.isChecked():
+                masks = self.pdf_handler.snap_masks_to_seams(
+                    masks, overlap_percent=overlap_percent
+                )
+            
             self.pdf_viewer.set_masks(masks)
             self.masks_label.setText(f"Масок: {len(masks)}")
             self.divide_btn.setEnabled(len(masks) > 0)
@@ -303,14 +538,172 @@ class MainWindow(QMainWindow):
         )
         
         if output_dir:
+            self.store_mask_overrides()
             try:
-                output_files = self.pdf_handler.divide_pdf(masks, output_dir)
-                QMessageBox.information(self, "Успех", 
-                    f"PDF успешно разделен!\nСоздано файлов: {len(output_files)}\nПапка: {output_dir}")
+                output_files = self.pdf_handler.divide_pdf(
+                    masks, output_dir, build_index=self.index_check.isChecked()
+                )
+                if self.index_check.isChecked():
+                    self.index_dir = output_dir
+                message = (f"PDF успешно разделен!\nСоздано файлов: {len(output_files)}"
+                           f"\nПапка: {output_dir}")
+                
+                if self.verify_check.isChecked():
+                    report = verify_split(self.pdf_handler.file_path, masks, output_files,
+                                          workers=self.resources.workers,
+                                          executor=self.resources.executor)
+                    message += "\n\n" + format_report(report)
+                    if not report['ok']:
+                        QMessageBox.warning(self, "Проверка разделения", message)
+                        return
+                
+                QMessageBox.information(self, "Успех", message)
             except Exception as e:
                 QMessageBox.critical(self, "Ошибка", 
                     f"Не удалось разделить PDF:\n{str(e)}")
     
+    def divide_all_documents(self):
+        """Разделение всех страниц открытых документов в общем пуле процессов"""
+        documents = [d for d in self.documents.values() if d.pdf_handler.is_loaded()]
+        if not documents:
+            QMessageBox.warning(self, "Предупреждение", "Сначала загрузите PDF файл")
+            return
+        
+        output_dir = QFileDialog.getExistingDirectory(
+            self, "Выберите папку для сохранения разделенных файлов"
+        )
+        if not output_dir:
+            return
+        
+        self.store_mask_overrides()
+        try:
+            scheduler = SplitScheduler(workers=self.resources.workers,
+                                       executor=self.resources.executor,
+                                       model=self.cost_model)
+            for document in documents:
+                # Для показанной страницы используются маски с экрана
+                masks = document.pdf_viewer.get_masks()
+                scheduler.add_document(
+                    document.pdf_handler, output_dir,
+                    overlap_percent=self.overlap_spin.value(),
+                    mask_format=self.mask_format_combo.currentText(),
+                    mask_landscape=self.orientation_combo.currentText() == "Альбомная",
+                    masks_by_page={document.pdf_viewer.current_page: masks} if masks else None,
+                    separate_documents=len(documents) > 1
+                )
+            
+            report = scheduler.run(build_index=self.index_check.isChecked(),
+                                   index_dir=output_dir)
+            if self.index_check.isChecked():
+                # Один индекс на все документы - в выбранной папке
+                self.index_dir = output_dir
+            message = (f"Разделение завершено\nПапка: {output_dir}\n\n"
+                       + format_schedule_report(report))
+            if report['errors']:
+                QMessageBox.warning(self, "Разделение документов", message)
+            else:
+                QMessageBox.information(self, "Разделение документов", message)
+        except Exception as e:
+            QMessageBox.critical(self, "Ошибка",
+                f"Не удалось разделить документы:\n{str(e)}")
+    
+    def compare_revision(self):
+        """Повторное разделение частей, затронутых изменениями новой редакции"""
+        if not self.pdf_handler.is_loaded():
+            QMessageBox.warning(self, "Предупреждение", "Сначала загрузите новую редакцию PDF")
+            return
+        
+        masks = self.pdf_viewer.get_masks()
+        if not masks:
+            QMessageBox.warning(self, "Предупреждение", "Нет масок для разделения")
+            return
+        
+        old_path, _ = QFileDialog.getOpenFileName(
+            self, "Предыдущая редакция", "", "PDF файлы (*.pdf)"
+        )
+        if not old_path:
+            return
+        
+        output_dir = QFileDialog.getExistingDirectory(
+            self, "Папка для измененных частей"
+        )
+        if not output_dir:
+            return
+        
+        try:
+            result = resplit_changed(self.pdf_handler, old_path, masks, output_dir,
+                                     page_num=self.pdf_viewer.current_page)
+            self.pdf_viewer.mark_changed_masks(result['indices'])
+            
+            if not result['indices']:
+                QMessageBox.information(self, "Сравнение редакций",
+                    "Изменений, затрагивающих маски, не найдено")
+                return
+            
+            import os
+            names = "\n".join(os.path.basename(f) for f in result['files'][:20])
+            if len(result['files']) > 20:
+                names += "\n..."
+            QMessageBox.information(self, "Сравнение редакций",
+                f"Измененных областей: {len(result['regions'])}\n"
+                f"Заново разделено частей: {len(result['files'])} из {len(masks)}\n\n"
+                f"{names}")
+        except Exception as e:
+            QMessageBox.critical(self, "Ошибка",
+                f"Не удалось сравнить редакции:\n{str(e)}")
+    
+    def choose_index_dir(self):
+        """Выбор папки разделения для поиска"""
+        output_dir = QFileDialog.getExistingDirectory(self, "Папка с разделенными частями")
+        if output_dir:
+            self.index_dir = output_dir
+            self.search_parts()
+    
+    def search_parts(self):
+        """Поиск частей по тексту в индексе папки разделения"""
+        import os
+        self.search_results.clear()
+        query = self.search_edit.text().strip()
+        if not query:
+            return
+        
+        if not self.index_dir or not os.path.exists(os.path.join(self.index_dir, INDEX_FILE_NAME)):
+            self.search_results.addItem("Индекс не найден: разделите PDF с индексом "
+                                        "или выберите папку с частями")
+            return
+        
+        text_index = TextIndex.for_directory(self.index_dir)
+        try:
+            results = text_index.search(query)
+        finally:
+            text_index.close()
+        
+        if not results:
+            self.search_results.addItem("Ничего не найдено")
+            return
+        
+        for result in results:
+            item = QListWidgetItem(f"{result['text']} — {os.path.basename(result['file'])}")
+            item.setData(Qt.UserRole, result)
+            self.search_results.addItem(item)
+    
+    def show_search_result(self, item):
+        """Переход к маске найденной части"""
+        import os
+        result = item.data(Qt.UserRole)
+        if not result:
+            return
+        
+        # Маски на экране соответствуют частям, только если открыт тот же лист
+        document = self.find_document(result['source'])
+        if document is not None:
+            self.tabs.setCurrentWidget(document.pdf_viewer)
+        same_sheet = (document is not None and
+                      self.pdf_viewer.current_page == result['page'])
+        if not same_sheet or not self.pdf_viewer.focus_mask(result['part_no'] - 1):
+            QMessageBox.information(self, "Поиск по частям",
+                f"{result['text']}\nЧасть: {result['file']}")
+    
     def rotate_selected_mask(self):
         self.pdf_viewer.rotate_selected_mask()
     
@@ -324,6 +717,9 @@ class MainWindow(QMainWindow):
     def clear_all_masks(self):
         """Очистка всех масок"""
         self.pdf_viewer.clear_all_masks()
+        # Очистка сбрасывает и ручные правки шаблона
+        self.pdf_handler.mask_templates.clear_override(self.template_key)
+        self.template_key = None
         self.masks_label.setText("Масок: 0")
         self.divide_btn.setEnabled(False)
         self.clear_masks_btn.setEnabled(False)
@@ -335,6 +731,21 @@ class MainWindow(QMainWindow):
         self.divide_btn.setEnabled(len(masks) > 0)
         self.clear_masks_btn.setEnabled(len(masks) > 0)
     
+    def toggle_seam_snapping(self, enabled):
+        """Включение привязки швов (индекс страницы строится один раз)"""
+        self.pdf_viewer.snap_to_seams = enabled
+        if enabled and self.pdf_handler.is_loaded():
+            self.pdf_handler.get_spatial_index(self.pdf_viewer.current_page)
+    
+    def store_mask_overrides(self):
+        """Сохранение ручных правок масок в шаблон раскладки"""
+        if self.template_key is None or not self.pdf_viewer.masks_modified:
+            return
+        self.pdf_handler.mask_templates.set_override(
+            self.template_key, self.pdf_viewer.get_masks()
+        )
+        self.pdf_viewer.masks_modified = False
+    
     def update_mask_info(self, mask_info):
         """Обновление информации о выбранной маске"""
         if mask_info:
@@ -346,6 +757,13 @@ class MainWindow(QMainWindow):
             self.rotate_btn.setEnabled(False)
             self.delete_btn.setEnabled(False)
     
+    def closeEvent(self, event):
+        """Закрытие документов и общего пула процессов"""
+        for document in self.documents.values():
+            document.pdf_handler.close()
+        self.resources.shutdown()
+        super().closeEvent(event)
+    
     def show_about(self):
         QMessageBox.about(self, "О программе",
             "<h3>Division Draw</h3>"
@@ -0,0 +1,119 @@
+"""
+Миникарта чертежа для быстрой навигации
+"""
+from PySide6.QtWidgets import QWidget, QSizePolicy
+from PySide6.QtCore import Qt, QRectF, QPointF
+from PySide6.QtGui import QPainter, QPen, QColor, QBrush
+
+
+class MinimapWidget(QWidget):
+    """Обзор страницы с масками и текущей видимой областью"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.viewer = None
+        self._scaled_pixmap = None
+        self._dragging = False
+
+        self.setMinimumSize(160, 160)
+        self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
+        self.setCursor(Qt.PointingHandCursor)
+
+    def set_viewer(self, viewer):
+        """Подключение к PDFViewer"""
+        if self.viewer is viewer:
+            return
+        if self.viewer is not None:
+            self.viewer.view_changed.disconnect(self.update)
+            self.viewer.page_loaded.disconnect(self.reset_overview)
+
+        self.viewer = viewer
+        if viewer is not None:
+            viewer.view_changed.connect(self.update)
+            viewer.page_loaded.connect(self.reset_overview)
+        self.reset_overview()
+
+    def reset_overview(self):
+        """Сброс масштабированного обзора (новая страница)"""
+        self._scaled_pixmap = None
+        self.update()
+
+    def _target_rect(self):
+        """Область виджета, в которой рисуется страница"""
+        scene_rect = self.viewer.scene.sceneRect() if self.viewer else QRectF()
+        if scene_rect.isEmpty():
+            return QRectF()
+
+        scale = min(self.width() / scene_rect.width(),
+                    self.height() / scene_rect.height())
+        width = scene_rect.width() * scale
+        height = scene_rect.height() * scale
+        return QRectF((self.width() - width) / 2, (self.height() - height) / 2,
+                      width, height)
+
+    def _scene_to_widget(self, rect, target):
+        scene_rect = self.viewer.scene.sceneRect()
+        sx = target.width() / scene_rect.width()
+        sy = target.height() / scene_rect.height()
+        return QRectF(
+            target.x() + (rect.x() - scene_rect.x()) * sx,
+            target.y() + (rect.y() - scene_rect.y()) * sy,
+            rect.width() * sx,
+            rect.height() * sy
+        )
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), QColor(70, 70, 70))
+
+        if not self.viewer or self.viewer.overview_pixmap is None:
+            return
+
+        target = self._target_rect()
+        if target.isEmpty():
+            return
+
+        # Обзор масштабируется под размер виджета один раз, а не при каждой перерисовке
+        size = target.size().toSize()
+        if self._scaled_pixmap is None or self._scaled_pixmap.size() != size:
+            self._scaled_pixmap = self.viewer.overview_pixmap.scaled(
+                size, Qt.IgnoreAspectRatio, Qt.SmoothTransformation
+            )
+        painter.drawPixmap(target.topLeft(), self._scaled_pixmap)
+
+        # Маски
+        painter.setPen(QPen(QColor(255, 0, 0), 1))
+        painter.setBrush(QBrush(QColor(255, 0, 0, 30)))
+        for mask in self.viewer.masks:
+            painter.drawRect(self._scene_to_widget(mask.sceneBoundingRect(), target))
+
+        # Видимая область основного окна
+        visible = self.viewer.visible_scene_rect()
+        painter.setPen(QPen(QColor(0, 120, 215), 2))
+        painter.setBrush(QBrush(QColor(0, 120, 215, 40)))
+        painter.drawRect(self._scene_to_widget(visible, target))
+
+    def _center_viewer(self, pos):
+        target = self._target_rect()
+        if not self.viewer or target.isEmpty():
+            return
+        scene_rect = self.viewer.scene.sceneRect()
+        x = scene_rect.x() + (pos.x() - target.x()) * scene_rect.width() / target.width()
+        y = scene_rect.y() + (pos.y() - target.y()) * scene_rect.height() / target.height()
+        self.viewer.centerOn(QPointF(x, y))
+
+    def mousePressEvent(self, event):
+        if event.button() == Qt.LeftButton:
+            self._dragging = True
+            self._center_viewer(event.position())
+
+    def mouseMoveEvent(self, event):
+        if self._dragging:
+            self._center_viewer(event.position())
+
+    def mouseReleaseEvent(self, event):
+        self._dragging = False
+
+    def resizeEvent(self, event):
+        self._scaled_pixmap = None
+        super().resizeEvent(event)
@@ -15,6 +15,8 @@ class MaskItem(QGraphicsRectItem):
         self.mask_id = mask_id
         self.is_landscape = is_landscape
         self.is_selected = False
+        # Содержимое под маской изменилось в новой редакции
+        self.is_changed = False
         
         # Стиль маски
         self.setFlags(
@@ -30,6 +32,9 @@ class MaskItem(QGraphicsRectItem):
         if self.is_selected:
             pen = QPen(QColor(0, 120, 215), 3, Qt.SolidLine)
             brush = QBrush(QColor(0, 120, 215, 40))
+        elif self.is_changed:
+            pen = QPen(QColor(255, 140, 0), 3, Qt.SolidLine)
+            brush = QBrush(QColor(255, 140, 0, 50))
         else:
             pen = QPen(QColor(255, 0, 0), 2, Qt.DashLine)
             brush = QBrush(QColor(255, 0, 0, 20))
@@ -42,6 +47,11 @@ class MaskItem(QGraphicsRectItem):
         self.is_selected = selected
         self.update_style()
     
+    def set_changed(self, changed):
+        """Отметка маски, затронутой изменениями редакции"""
+        self.is_changed = changed
+        self.update_style()
+    
     def rotate_90(self):
         """Поворот маски на 90 градусов"""
         rect = self.rect()
@@ -62,6 +72,14 @@ class MaskItem(QGraphicsRectItem):
         self.setRect(new_rect)
         self.is_landscape = not self.is_landscape
     
+    def itemChange(self, change, value):
+        """Привязка швов к свободным зонам при перетаскивании"""
+        if change == QGraphicsRectItem.ItemPositionChange and self.scene():
+            for view in self.scene().views():
+                if isinstance(view, PDFViewer):
+                    return view.snap_position(self, value)
+        return super().itemChange(change, value)
+    
     def get_mask_data(self):
         """Получение данных маски для разделения PDF"""
         rect = self.rect()
@@ -81,6 +99,14 @@ class PDFViewer(QGraphicsView):
     """Виджет для отображения PDF и работы с масками"""
     
     mask_selected = Signal(str)  # Сигнал при выборе маски
+    view_changed = Signal()  # Изменилась видимая область или маски
+    page_loaded = Signal()  # Загружена новая страница
+    masks_changed = Signal()  # Изменен набор масок (и нумерация частей)
+    mask_changed = Signal(object)  # Маска перемещена или повернута
+    
+    OVERVIEW_MAX_SIDE = 2048  # Размер обзора страницы, px
+    
+    SNAP_RADIUS_PT = 14.0  # Радиус привязки швов при перетаскивании (~5 мм)
     
     def __init__(self):
         super().__init__()
@@ -91,9 +117,21 @@ class PDFViewer(QGraphicsView):
         self.current_page = 0
         self.render_zoom = 2.0  # Zoom для рендеринга PDF
         self.pdf_pixmap_item = None
+        # Полный растр и обзор низкого разрешения
+        self.full_pixmap = None
+        self.overview_pixmap = None
+        self.overview_zoom = None
+        self._overview_cache = {}
         self.masks = []
         self.selected_mask = None
         self.next_mask_id = 1
+        # Маски изменены вручную после генерации
+        self.masks_modified = False
+        self._press_pos = None
+        # Привязка швов к зонам без текста и плотной графики
+        self.snap_to_seams = False
+        # Общий бюджет памяти растров (при нескольких открытых документах)
+        self.memory_budget = None
         
         # Настройки view
         self.setDragMode(QGraphicsView.NoDrag)  # Изначально без драга
@@ -113,14 +151,19 @@ class PDFViewer(QGraphicsView):
         
         # Очищаем сцену
         self.scene.clear()
+        self.pdf_pixmap_item = None
         self.masks.clear()
         self.selected_mask = None
+        self.masks_modified = False
         
         # Получаем изображение страницы с нужным zoom
-        pixmap = self.pdf_handler.render_page(page_num, zoom=self.render_zoom)
+        self.full_pixmap = None
+        self.ensure_full_pixmap()
+        self.overview_pixmap, self.overview_zoom = self.get_overview(page_num)
         
         # Добавляем изображение на сцену
-        self.pdf_pixmap_item = QGraphicsPixmapItem(pixmap)
+        self.pdf_pixmap_item = QGraphicsPixmapItem(self.full_pixmap)
+        self.pdf_pixmap_item.setTransformationMode(Qt.SmoothTransformation)
         self.scene.addItem(self.pdf_pixmap_item)
         
         # Устанавливаем размер сцены
@@ -128,6 +171,132 @@ class PDFViewer(QGraphicsView):
         
         # Подгоняем под размер окна
         self.fitInView(self.scene.sceneRect(), Qt.KeepAspectRatio)
+        self.update_level_of_detail()
+        self.register_rasters()
+        
+        self.page_loaded.emit()
+        self.view_changed.emit()
+    
+    def get_overview(self, page_num):
+        """Обзор страницы низкого разрешения (с кэшем)"""
+        key = (self.pdf_handler.file_path, page_num)
+        if key not in self._overview_cache:
+            overview, zoom = self.pdf_handler.render_overview(
+                page_num, max_side=self.OVERVIEW_MAX_SIDE
+            )
+            # Обзор не детальнее основного растра
+            if zoom is not None and zoom >= self.render_zoom:
+                overview, zoom = self.ensure_full_pixmap(), self.render_zoom
+            self._overview_cache[key] = (overview, zoom)
+        return self._overview_cache[key]
+    
+    def ensure_full_pixmap(self):
+        """Полный растр текущей страницы (рендерится заново после освобождения)"""
+        if self.full_pixmap is None:
+            self.full_pixmap = self.pdf_handler.render_page(
+                self.current_page, zoom=self.render_zoom
+            )
+            if self.pdf_pixmap_item is not None:
+                self.register_rasters()
+        elif self.memory_budget is not None:
+            self.memory_budget.touch(self, 'full')
+        return self.full_pixmap
+    
+    @staticmethod
+    def _pixmap_nbytes(pixmap):
+        return pixmap.width() * pixmap.height() * max(pixmap.depth(), 8) // 8
+    
+    def register_rasters(self):
+        """Учет растров вида в общем бюджете памяти"""
+        budget = self.memory_budget
+        if budget is None or not self.pdf_handler:
+            return
+        
+        current_key = (self.pdf_handler.file_path, self.current_page)
+        # register() может освободить обзоры из кэша - обходим копию
+        for key, (pixmap, _) in list(self._overview_cache.items()):
+            if key not in self._overview_cache:
+                continue
+            if pixmap is None or pixmap is self.full_pixmap:
+                continue
+            budget.register(
+                self, ('overview',) + key,
+                'overview' if key == current_key else 'cache',
+                self._pixmap_nbytes(pixmap),
+                lambda key=key: self.release_overview(key)
+            )
+        
+        # Для небольших страниц обзор и есть полный растр
+        if self.full_pixmap is not None and self.full_pixmap is not self.overview_pixmap:
+            budget.register(self, 'full', 'full', self._pixmap_nbytes(self.full_pixmap),
+                            self.release_full_pixmap)
+        else:
+            budget.unregister(self, 'full')
+    
+    def release_full_pixmap(self):
+        """Освобождение полного растра (остается обзор)"""
+        if self.full_pixmap is None or self.full_pixmap is self.overview_pixmap:
+            return
+        self.full_pixmap = None
+        if self.pdf_pixmap_item is not None:
+            if self.overview_pixmap is not None:
+                self.pdf_pixmap_item.setPixmap(self.overview_pixmap)
+                self.pdf_pixmap_item.setScale(self.render_zoom / self.overview_zoom)
+            else:
+                self.pdf_pixmap_item.setPixmap(QPixmap())
+    
+    def release_overview(self, key):
+        """Освобождение обзора страницы из кэша"""
+        overview, _ = self._overview_cache.pop(key, (None, None))
+        if overview is None or overview is not self.overview_pixmap:
+            return
+        # Обзор текущей страницы: вкладка неактивна, растр восстановится при показе
+        self.overview_pixmap = None
+        self.overview_zoom = None
+        if self.pdf_pixmap_item is not None and self.full_pixmap is None:
+            self.pdf_pixmap_item.setPixmap(QPixmap())
+    
+    def restore_rasters(self):
+        """Восстановление освобожденных растров при показе вкладки"""
+        if not self.pdf_pixmap_item or not self.pdf_handler or not self.pdf_handler.is_loaded():
+            return
+        self.update_level_of_detail()
+        self.register_rasters()
+    
+    def update_level_of_detail(self):
+        """
+        Выбор растра по масштабу отображения
+        
+        Пока на экране пикселей меньше, чем в обзоре, отображается обзор:
+        перерисовка уменьшенного вида не пересчитывает полный растр.
+        """
+        if not self.pdf_pixmap_item:
+            return
+        if self.overview_pixmap is None:
+            self.overview_pixmap, self.overview_zoom = self.get_overview(self.current_page)
+            self.register_rasters()
+        
+        view_scale = self.transform().m11()
+        use_overview = view_scale <= self.overview_zoom / self.render_zoom
+        pixmap = self.overview_pixmap if use_overview else self.ensure_full_pixmap()
+        
+        if self.pdf_pixmap_item.pixmap().cacheKey() != pixmap.cacheKey():
+            self.pdf_pixmap_item.setPixmap(pixmap)
+            self.pdf_pixmap_item.setScale(
+                self.render_zoom / self.overview_zoom if use_overview else 1.0
+            )
+    
+    def visible_scene_rect(self):
+        """Видимая область в координатах сцены"""
+        return self.mapToScene(self.viewport().rect()).boundingRect()
+    
+    def scrollContentsBy(self, dx, dy):
+        super().scrollContentsBy(dx, dy)
+        self.view_changed.emit()
+    
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.view_changed.emit()
     
     def set_masks(self, masks_data):
         """Установка масок на основе данных"""
@@ -137,6 +306,7 @@ class PDFViewer(QGraphicsView):
         
         self.masks.clear()
         self.selected_mask = None
+        self.masks_modified = False
         
         # Создаем новые маски с учетом zoom фактора
         for mask_data in masks_data:
@@ -154,6 +324,9 @@ class PDFViewer(QGraphicsView):
             
             self.scene.addItem(mask_item)
             self.masks.append(mask_item)
+        
+        self.masks_changed.emit()
+        self.view_changed.emit()
     
     def add_mask(self, mask_format='A4', landscape=False):
         """Добавление новой маски"""
@@ -183,6 +356,9 @@ class PDFViewer(QGraphicsView):
         
         self.scene.addItem(mask_item)
         self.masks.append(mask_item)
+        self.masks_modified = True
+        self.masks_changed.emit()
+        self.view_changed.emit()
     
     def get_masks(self):
         """Получение данных всех масок (в оригинальных координатах PDF)"""
@@ -200,6 +376,61 @@ class PDFViewer(QGraphicsView):
             })
         return masks_data
     
+    def focus_mask(self, index):
+        """Выделение маски (по номеру с 0) и переход к ней"""
+        if not 0 <= index < len(self.masks):
+            return False
+        
+        if self.selected_mask:
+            self.selected_mask.set_selected(False)
+        
+        mask = self.masks[index]
+        self.selected_mask = mask
+        mask.set_selected(True)
+        self.centerOn(mask.sceneBoundingRect().center())
+        
+        mask_info = (f"Маска #{mask.mask_id}\n"
+                    f"Ориентация: {'альбомная' if mask.is_landscape else 'книжная'}\n"
+                    f"Размер: {mask.rect().width():.1f} × {mask.rect().height():.1f}")
+        main_window = self.window()
+        if hasattr(main_window, 'update_mask_info'):
+            main_window.update_mask_info(mask_info)
+        return True
+    
+    def mark_changed_masks(self, indices):
+        """Отметка масок (по номерам с 0), затронутых изменениями"""
+        indices = set(indices)
+        for i, mask in enumerate(self.masks):
+            mask.set_changed(i in indices)
+    
+    def snap_position(self, mask_item, pos):
+        """Скорректированная позиция маски с учетом привязки швов"""
+        if not self.snap_to_seams or not self.pdf_handler or not self.pdf_handler.is_loaded():
+            return pos
+        
+        index = self.pdf_handler.get_spatial_index(self.current_page)
+        if index is None:
+            return pos
+        
+        rect = mask_item.rect()
+        zoom = self.render_zoom
+        radius = self.SNAP_RADIUS_PT
+        
+        orig_x = (pos.x() + rect.x()) / zoom
+        orig_y = (pos.y() + rect.y()) / zoom
+        x, y = index.snap_mask(
+            orig_x,
+            orig_y,
+            rect.width() / zoom,
+            rect.height() / zoom,
+            (-radius, radius),
+            (-radius, radius)
+        )
+        # Привязка не выводит маску за левый/верхний край страницы
+        x = max(x, min(orig_x, 0.0))
+        y = max(y, min(orig_y, 0.0))
+        return QPointF(x * zoom - rect.x(), y * zoom - rect.y())
+    
     def mousePressEvent(self, event):
         """Обработка нажатия мыши для выбора масок"""
         # Получаем позицию в координатах сцены
@@ -217,6 +448,7 @@ class PDFViewer(QGraphicsView):
         if isinstance(item, MaskItem):
             self.selected_mask = item
             item.set_selected(True)
+            self._press_pos = item.pos()
             
             # Временно отключаем ScrollHandDrag для перемещения маски
             self.setDragMode(QGraphicsView.NoDrag)
@@ -244,6 +476,9 @@ class PDFViewer(QGraphicsView):
         """Поворот выбранной маски"""
         if self.selected_mask:
             self.selected_mask.rotate_90()
+            self.masks_modified = True
+            self.mask_changed.emit(self.selected_mask)
+            self.view_changed.emit()
             
             # Обновляем информацию о маске
             mask_info = (f"Маска #{self.selected_mask.mask_id}\n"
@@ -260,6 +495,9 @@ class PDFViewer(QGraphicsView):
             self.scene.removeItem(self.selected_mask)
             self.masks.remove(self.selected_mask)
             self.selected_mask = None
+            self.masks_modified = True
+            self.masks_changed.emit()
+            self.view_changed.emit()
             
             # Обновляем информацию
             main_window = self.window()
@@ -273,6 +511,9 @@ class PDFViewer(QGraphicsView):
         
         self.masks.clear()
         self.selected_mask = None
+        self.masks_modified = False
+        self.masks_changed.emit()
+        self.view_changed.emit()
         
         # Обновляем информацию
         main_window = self.window()
@@ -282,6 +523,13 @@ class PDFViewer(QGraphicsView):
     def mouseReleaseEvent(self, event):
         """Обработка отпускания кнопки мыши"""
         super().mouseReleaseEvent(event)
+        # Отмечаем перемещение маски
+        if self.selected_mask and self._press_pos is not None:
+            if self.selected_mask.pos() != self._press_pos:
+                self.masks_modified = True
+                self.mask_changed.emit(self.selected_mask)
+                self.view_changed.emit()
+            self._press_pos = None
         # Восстанавливаем ScrollHandDrag если маска не выбрана
         if not self.selected_mask:
             self.setDragMode(QGraphicsView.ScrollHandDrag)
@@ -309,6 +557,9 @@ class PDFViewer(QGraphicsView):
         # Корректируем позицию
         delta = new_pos - old_pos
         self.translate(delta.x(), delta.y())
+        
+        self.update_level_of_detail()
+        self.view_changed.emit()
     
     def keyPressEvent(self, event):
         """Обработка нажатий клавиш"""
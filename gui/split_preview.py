@@ -0,0 +1,137 @@
+"""
+Предпросмотр частей разделения
+
+Каждая маска показывается миниатюрой в порядке номеров частей.
+Миниатюры вырезаются из уже отрисованного растра страницы (обзора или
+полного растра), PDF при этом не создаются. При перемещении или повороте
+маски обновляется только ее миниатюра.
+"""
+from PySide6.QtWidgets import QListWidget, QListWidgetItem, QListView
+from PySide6.QtCore import Qt, QSize, QRectF
+from PySide6.QtGui import QPixmap, QPainter, QColor, QIcon, QPen
+
+
+class SplitPreviewWidget(QListWidget):
+    """Сетка миниатюр частей"""
+
+    THUMBNAIL_SIZE = 160
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.viewer = None
+        self._dirty = False
+
+        self.setViewMode(QListView.IconMode)
+        self.setIconSize(QSize(self.THUMBNAIL_SIZE, self.THUMBNAIL_SIZE))
+        self.setResizeMode(QListView.Adjust)
+        self.setMovement(QListView.Static)
+        self.setUniformItemSizes(True)
+        self.setSpacing(4)
+        self.itemClicked.connect(self._focus_mask)
+
+    def set_viewer(self, viewer):
+        """Подключение к PDFViewer"""
+        if self.viewer is viewer:
+            return
+        if self.viewer is not None:
+            self.viewer.page_loaded.disconnect(self.rebuild)
+            self.viewer.masks_changed.disconnect(self.rebuild)
+            self.viewer.mask_changed.disconnect(self.update_mask)
+
+        self.viewer = viewer
+        if viewer is not None:
+            viewer.page_loaded.connect(self.rebuild)
+            viewer.masks_changed.connect(self.rebuild)
+            viewer.mask_changed.connect(self.update_mask)
+        self.rebuild()
+
+    def rebuild(self):
+        """Пересоздание всех миниатюр"""
+        if not self.isVisible():
+            # Скрытая панель обновляется при показе
+            self._dirty = True
+            return
+        self._dirty = False
+
+        self.clear()
+        if self.viewer is None:
+            return
+        for index, mask in enumerate(self.viewer.masks):
+            item = QListWidgetItem(f"Часть {index + 1}")
+            item.setIcon(QIcon(self.render_thumbnail(mask)))
+            item.setData(Qt.UserRole, index)
+            self.addItem(item)
+
+    def update_mask(self, mask):
+        """Обновление миниатюры одной маски"""
+        if not self.isVisible():
+            self._dirty = True
+            return
+        if self.viewer is None or mask not in self.viewer.masks:
+            return
+
+        index = self.viewer.masks.index(mask)
+        item = self.item(index)
+        if item is None:
+            self.rebuild()
+            return
+        item.setIcon(QIcon(self.render_thumbnail(mask)))
+
+    def _source_pixmap(self, rect):
+        """
+        Растр для вырезания миниатюры: обзора достаточно, если в нем
+        не меньше пикселей, чем в миниатюре
+
+        Returns:
+            tuple: (растр, масштаб растра относительно сцены)
+        """
+        viewer = self.viewer
+        side = max(rect.width(), rect.height())
+        if viewer.overview_pixmap is not None and viewer.overview_zoom:
+            scale = viewer.overview_zoom / viewer.render_zoom
+            if side * scale >= self.THUMBNAIL_SIZE or viewer.full_pixmap is None:
+                return viewer.overview_pixmap, scale
+        if viewer.full_pixmap is not None:
+            return viewer.full_pixmap, 1.0
+        return None, 1.0
+
+    def render_thumbnail(self, mask):
+        """Миниатюра области маски (в координатах сцены)"""
+        # Прямоугольник маски без толщины рамки
+        rect = mask.mapRectToScene(mask.rect())
+
+        ratio = self.THUMBNAIL_SIZE / max(rect.width(), rect.height(), 1)
+        size = QSize(max(1, round(rect.width() * ratio)), max(1, round(rect.height() * ratio)))
+        thumbnail = QPixmap(size)
+        # За пределами листа часть будет пустой
+        thumbnail.fill(QColor(255, 255, 255))
+
+        source, scale = self._source_pixmap(rect)
+        if source is not None:
+            page_rect = self.viewer.scene.sceneRect()
+            visible = rect.intersected(page_rect)
+            if not visible.isEmpty():
+                source_rect = QRectF(visible.x() * scale, visible.y() * scale,
+                                     visible.width() * scale, visible.height() * scale)
+                target_rect = QRectF((visible.x() - rect.x()) * ratio,
+                                     (visible.y() - rect.y()) * ratio,
+                                     visible.width() * ratio, visible.height() * ratio)
+                painter = QPainter(thumbnail)
+                painter.setRenderHint(QPainter.SmoothPixmapTransform)
+                painter.drawPixmap(target_rect, source, source_rect)
+                painter.end()
+
+        painter = QPainter(thumbnail)
+        painter.setPen(QPen(QColor(160, 160, 160), 1))
+        painter.drawRect(0, 0, size.width() - 1, size.height() - 1)
+        painter.end()
+        return thumbnail
+
+    def _focus_mask(self, item):
+        if self.viewer is not None:
+            self.viewer.focus_mask(item.data(Qt.UserRole))
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        if self._dirty:
+            self.rebuild()
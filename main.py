@@ -3,16 +3,118 @@ PDF Division Draw Application
 Приложение для разделения больших PDF чертежей на форматы А4
 """
 import sys
-from PySide6.QtWidgets import QApplication
-from gui.main_window import MainWindow
+import argparse
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Division Draw")
+    parser.add_argument('--serve', action='store_true',
+                        help="запуск локального HTTP-сервиса разделения вместо GUI")
+    parser.add_argument('--host', default='127.0.0.1', help="адрес сервиса")
+    parser.add_argument('--port', type=int, default=8765, help="порт сервиса")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="количество процессов-обработчиков")
+    parser.add_argument('--split', metavar='PDF', nargs='+',
+                        help="разделение всех страниц документов без GUI "
+                             "(с --workers - параллельно, от самых тяжелых страниц)")
+    parser.add_argument('--output', default='.', help="папка для разделенных файлов")
+    parser.add_argument('--format', default='A4', choices=['A4', 'A3'], help="формат маски")
+    parser.add_argument('--landscape', action='store_true', help="альбомная ориентация маски")
+    parser.add_argument('--overlap', type=float, default=15, help="перекрытие, %%")
+    parser.add_argument('--index', action='store_true',
+                        help="сохранить текстовый индекс частей")
+    parser.add_argument('--rss-limit', type=int, default=2048,
+                        help="лимит резидентной памяти, МБ (0 - без лимита)")
+    parser.add_argument('--memory-budget', type=int, default=2048,
+                        help="общий бюджет растров и кэшей открытых документов, МБ "
+                             "(0 - без лимита)")
+    args, _ = parser.parse_known_args()
+    return args
+
+
+def split_document(args):
+    """Разделение документов в потоковом режиме"""
+    import os
+    from core.stream_processor import StreamingPDFHandler
+    
+    total_files = 0
+    for path in args.split:
+        output_dir = args.output
+        # Несколько документов - части каждого в своей подпапке
+        if len(args.split) > 1:
+            output_dir = os.path.join(args.output,
+                                      os.path.splitext(os.path.basename(path))[0])
+        
+        handler = StreamingPDFHandler(rss_limit_mb=args.rss_limit)
+        handler.load_pdf(path)
+        try:
+            results = handler.divide_document(
+                output_dir,
+                overlap_percent=args.overlap,
+                mask_format=args.format,
+                mask_landscape=args.landscape,
+                build_index=args.index,
+                progress_callback=lambda page_num, total: print(
+                    f"{os.path.basename(path)}: страница {page_num + 1}/{total}")
+            )
+        finally:
+            handler.close()
+        total_files += sum(len(files) for files in results.values())
+    
+    print(f"Создано файлов: {total_files}")
+
+
+def split_parallel(args):
+    """Параллельное разделение документов с планированием по стоимости страниц"""
+    from core.pdf_handler import PDFHandler
+    from core.split_scheduler import SplitScheduler, format_schedule_report
+    
+    scheduler = SplitScheduler(workers=args.workers)
+    handler = PDFHandler()
+    for path in args.split:
+        handler.load_pdf(path)
+        try:
+            scheduler.add_document(
+                handler, args.output,
+                overlap_percent=args.overlap,
+                mask_format=args.format,
+                mask_landscape=args.landscape,
+                separate_documents=len(args.split) > 1
+            )
+        finally:
+            handler.close()
+    
+    report = scheduler.run(
+        build_index=args.index,
+        index_dir=args.output,
+        progress_callback=lambda done, total: print(f"Заданий выполнено: {done}/{total}")
+    )
+    print(format_schedule_report(report))
 
 
 def main():
+    args = parse_args()
+    
+    if args.serve:
+        from core.split_service import run_service
+        run_service(host=args.host, port=args.port, workers=args.workers)
+        return
+    
+    if args.split:
+        if args.workers:
+            split_parallel(args)
+        else:
+            split_document(args)
+        return
+    
+    from PySide6.QtWidgets import QApplication
+    from gui.main_window import MainWindow
+    
     app = QApplication(sys.argv)
     app.setApplicationName("Division Draw")
     app.setOrganizationName("PDFTools")
     
-    window = MainWindow()
+    window = MainWindow(memory_limit_mb=args.memory_budget, workers=args.workers)
     window.show()
     
     sys.exit(app.exec())
@@ -20,4 +122,3 @@ def main():
 
 if __name__ == "__main__":
     main()
-